@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from mistralai import Mistral
+import config
+from cancellation import CancellationToken, RequestCancelled
+from neo4j_client import get_neo4j_client
+from neighborhood_store import get_neighborhood_store
+from entity_gazetteer import get_gazetteer
+from instrumentation import metrics
+from pipeline import process_query_with_deep_reasoning
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineServer:
+    # Headless asyncio HTTP service running the reasoning pipeline: POST /ask, GET /health, GET /metrics
+
+    def __init__(self, api_key=None, max_concurrency=None, request_timeout=None):
+        self.max_concurrency = max_concurrency or config.API_MAX_CONCURRENCY
+        self.request_timeout = request_timeout or config.API_REQUEST_TIMEOUT
+        # One Mistral client (and its HTTP connection pool) shared by all requests;
+        # Neo4j queries share the global driver pool through get_neo4j_client()
+        self.client = Mistral(api_key=api_key or config.MISTRAL_API_KEY)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="pipeline")
+        self._semaphore = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests_total": 0,
+            "requests_failed": 0,
+            "requests_timed_out": 0,
+            "in_flight": 0,
+            "duration_seconds_sum": 0.0
+        }
+
+    async def serve(self, host=None, port=None):
+        # Start listening and serve until cancelled
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._warm_up()
+        server = await asyncio.start_server(
+            self._handle_connection, host or config.API_HOST, port or config.API_PORT
+        )
+        async with server:
+            await server.serve_forever()
+
+    async def ask(self, payload):
+        # Run the pipeline for one question with bounded concurrency and a per-request timeout
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return HTTPStatus.BAD_REQUEST, {"error": "'question' must be a non-empty string"}
+
+        history = payload.get("history") or []
+        if not isinstance(history, list) or not all(
+                isinstance(msg, dict) and "role" in msg and "content" in msg for msg in history):
+            return HTTPStatus.BAD_REQUEST, {"error": "'history' must be a list of {role, content} messages"}
+
+        model_option = payload.get("model", config.AVAILABLE_MODELS[0])
+        if model_option not in config.AVAILABLE_MODELS:
+            return HTTPStatus.BAD_REQUEST, {"error": f"'model' must be one of {config.AVAILABLE_MODELS}"}
+
+        # Include the new question in the history, as the Streamlit app does
+        history = history + [{"role": "user", "content": question}]
+
+        started = time.perf_counter()
+        self._count("requests_total")
+        # The worker thread cannot be interrupted, so the pipeline stops itself through the token
+        token = CancellationToken(self.request_timeout)
+        try:
+            answer, source_type, metadata = await asyncio.wait_for(
+                self._run_pipeline(question, history, model_option, token), timeout=self.request_timeout
+            )
+        except (asyncio.TimeoutError, RequestCancelled):
+            token.cancel("timed_out")
+            self._count("requests_timed_out")
+            return HTTPStatus.GATEWAY_TIMEOUT, {"error": "Request timed out"}
+        except BaseException as e:
+            # Includes the client going away (the handler task is cancelled)
+            token.cancel("abandoned")
+            if not isinstance(e, Exception):
+                raise
+            self._count("requests_failed")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+        finally:
+            self._count("duration_seconds_sum", time.perf_counter() - started)
+
+        return HTTPStatus.OK, {"answer": answer, "source_type": source_type, "metadata": metadata}
+
+    async def health(self):
+        # Liveness of the service and its Neo4j connection
+        loop = asyncio.get_running_loop()
+        try:
+            neo4j_ok = await asyncio.wait_for(
+                loop.run_in_executor(None, lambda: get_neo4j_client().test_connection()), timeout=5
+            )
+        except Exception:
+            neo4j_ok = False
+        status = HTTPStatus.OK if neo4j_ok else HTTPStatus.SERVICE_UNAVAILABLE
+        return status, {"status": "ok" if neo4j_ok else "degraded", "neo4j": neo4j_ok}
+
+    def metrics(self):
+        # Prometheus text exposition of request counters plus pipeline, LLM and Cypher metrics
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lines = [
+            "# TYPE api_requests_total counter",
+            f"api_requests_total {stats['requests_total']}",
+            "# TYPE api_requests_failed_total counter",
+            f"api_requests_failed_total {stats['requests_failed']}",
+            "# TYPE api_requests_timed_out_total counter",
+            f"api_requests_timed_out_total {stats['requests_timed_out']}",
+            "# TYPE api_requests_in_flight gauge",
+            f"api_requests_in_flight {stats['in_flight']}",
+            "# TYPE api_request_duration_seconds_sum counter",
+            f"api_request_duration_seconds_sum {stats['duration_seconds_sum']:.6f}",
+            "# TYPE api_max_concurrency gauge",
+            f"api_max_concurrency {self.max_concurrency}"
+        ]
+        return "\n".join(lines) + "\n" + metrics.render_prometheus()
+
+    async def _run_pipeline(self, question, history, model_option, cancel_token=None):
+        # Wait for a free slot, then run the blocking pipeline in the worker pool
+        async with self._semaphore:
+            self._count("in_flight")
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor,
+                    lambda: process_query_with_deep_reasoning(
+                        self.client, question, conversation_history=history, model_option=model_option,
+                        cancel_token=cancel_token
+                    )
+                )
+            finally:
+                self._count("in_flight", -1)
+
+    async def _warm_up(self):
+        # Open the Neo4j driver pool, build the entity gazetteer and load the neighborhood store before
+        # the first request arrives
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, get_neo4j_client)
+        except Exception as e:
+            logger.warning("Neo4j warm-up failed: %s", e)
+        if config.GAZETTEER_ENABLED:
+            try:
+                await loop.run_in_executor(None, get_gazetteer)
+            except Exception as e:
+                logger.warning("Entity gazetteer warm-up failed: %s", e)
+        if config.NEIGHBORHOOD_STORE_ENABLED:
+            await loop.run_in_executor(None, get_neighborhood_store)
+
+    async def _handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 handling: one request per connection
+        try:
+            status, body, content_type = await self._handle_request(reader)
+        except Exception:
+            status, body, content_type = HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}, "application/json"
+
+        payload = body if isinstance(body, str) else json.dumps(body, default=str)
+        data = payload.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader):
+        # Parse the request and dispatch it; returns (status, body, content type)
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        method, path, _ = request_line.split(" ", 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > config.API_MAX_BODY_BYTES:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large"}, "application/json"
+        raw_body = await reader.readexactly(length) if length else b""
+
+        path = path.split("?", 1)[0]
+        if path == "/ask" and method == "POST":
+            try:
+                payload = json.loads(raw_body or b"{}")
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, {"error": "Body must be JSON"}, "application/json"
+            if not isinstance(payload, dict):
+                return HTTPStatus.BAD_REQUEST, {"error": "Body must be a JSON object"}, "application/json"
+            status, body = await self.ask(payload)
+            return status, body, "application/json"
+        if path == "/health" and method == "GET":
+            status, body = await self.health()
+            return status, body, "application/json"
+        if path == "/metrics" and method == "GET":
+            return HTTPStatus.OK, self.metrics(), "text/plain; version=0.0.4"
+        if path in ("/ask", "/health", "/metrics"):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Method not allowed"}, "application/json"
+        return HTTPStatus.NOT_FOUND, {"error": "Not found"}, "application/json"
+
+    def _count(self, stat, amount=1):
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the reasoning pipeline over HTTP")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--max-concurrency", type=int, default=config.API_MAX_CONCURRENCY,
+                        help="Pipelines running at the same time; further requests wait")
+    parser.add_argument("--timeout", type=float, default=config.API_REQUEST_TIMEOUT,
+                        help="Per-request timeout in seconds")
+    args = parser.parse_args()
+
+    server = PipelineServer(max_concurrency=args.max_concurrency, request_timeout=args.timeout)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,50 @@
+import contextlib
+import logging
 import streamlit as st
 from mistralai import Mistral
 import config
-from query_classifier import classify_question
-from deep_analysis import deep_analysis_of_question
-from query_generator import generate_multiple_cypher_queries
-from query_executor import execute_multiple_queries
-from response_generator import synthesize_comprehensive_answer, generate_direct_answer
-
-def process_query_with_deep_reasoning(client, question, conversation_history=None, model_option="Auto (tries multiple)"):
-
-    # PHASE 1: Initial classification
-    query_type = classify_question(client, question, model_option)
-
-    if query_type == "DIRECT":
-        # Question doesn't require graph search - provide direct answer
-        answer = generate_direct_answer(client, question, conversation_history, model_option)
-        return answer, "direct", None
-
-    # PHASE 2: Deep analysis of the question
-    # This is where the AI "thinks deeply" about the question
-    with st.spinner("Analyzing question deeply..."):
-        analysis = deep_analysis_of_question(client, question, conversation_history, model_option)
-
-    # Check if analysis determined no graph search is needed
-    if analysis["query_strategy"] == "no_graph_needed" or not analysis["entities"]:
-        answer = generate_direct_answer(client, question, conversation_history, model_option)
-        return answer, "direct", analysis
-
-    # PHASE 3: Generate multiple strategic queries based on analysis
-    with st.spinner("Planning query strategy..."):
-        queries_list = generate_multiple_cypher_queries(client, question, analysis, conversation_history, model_option)
-
-    if not queries_list:
-        # Fallback to direct answer if no queries generated
-        answer = generate_direct_answer(client, question, conversation_history, model_option)
-        return answer, "direct", analysis
-
-    # PHASE 4: Execute all queries and collect results
-    with st.spinner(f"Executing {len(queries_list)} targeted queries..."):
-        query_results = execute_multiple_queries(queries_list)
-
-    if not query_results or all(result['count'] == 0 for result in query_results):
-        # No results found - provide direct answer
-        answer = generate_direct_answer(client, question, conversation_history, model_option)
-        return answer, "direct", analysis
-
-    # PHASE 5: Synthesize comprehensive answer from all results
-    with st.spinner("Synthesizing comprehensive answer..."):
-        answer = synthesize_comprehensive_answer(
-            client, question, analysis, query_results, conversation_history, model_option
-        )
+import pipeline
+from cancellation import CancellationToken, RequestCancelled
+from neo4j_client import get_neo4j_client
+from conversation_context import trim_history, SUMMARY_ROLE
+from entity_gazetteer import get_gazetteer
+
+logger = logging.getLogger(__name__)
+
+
+def process_query_with_deep_reasoning(client, question, conversation_history=None, model_option="Auto (tries multiple)",
+                                      fused_analysis=None, stream=False, cancel_token=None):
+    # Run the reasoning pipeline with Streamlit spinners as progress display
+    return pipeline.process_query_with_deep_reasoning(
+        client, question, conversation_history, model_option,
+        fused_analysis=fused_analysis, stream=stream, status=_spinner_status, cancel_token=cancel_token
+    )
+
+
+def cancel_abandoned_request():
+    # A new script run means the previous run of this session was interrupted (rerun, new input or the
+    # user navigated away): stop its queries and LLM calls still running on worker threads
+    token = st.session_state.pop("cancel_token", None)
+    if token is not None:
+        token.cancel("abandoned")
 
-    return answer, "graph_multi_query", {
-        "analysis": analysis,
-        "queries_executed": len(queries_list),
-        "total_results": sum(r['count'] for r in query_results)
-    }
+
+def _spinner_status(phase, message):
+    # Show a spinner for phases that have a progress message
+    return st.spinner(message) if message else contextlib.nullcontext()
+
+
+@st.cache_resource
+def warm_up_neo4j():
+    # Connect and warm up the Neo4j pool and build the entity gazetteer once per server process,
+    # before the first question
+    client = get_neo4j_client()
+    if config.GAZETTEER_ENABLED:
+        try:
+            get_gazetteer()
+        except Exception as e:
+            logger.warning("Entity gazetteer warm-up failed: %s", e)
+    return client
 
 
 def initialize_session_state():
@@ -108,6 +97,8 @@ def render_sidebar():
 def display_chat_history():
     # Display chat message history
     for msg in st.session_state.messages:
+        if msg["role"] == SUMMARY_ROLE:
+            continue  # folded older turns, only used as prompt context
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
 
@@ -126,6 +117,8 @@ def handle_user_input(mistral_api_key, model_option):
             st.write(prompt)
 
         # Generate response with deep reasoning
+        token = CancellationToken(config.UI_REQUEST_TIMEOUT)
+        st.session_state["cancel_token"] = token
         with st.chat_message("assistant"):
             try:
                 client = Mistral(api_key=mistral_api_key)
@@ -134,10 +127,16 @@ def handle_user_input(mistral_api_key, model_option):
                     client,
                     prompt,
                     conversation_history=st.session_state.messages,
-                    model_option=model_option
+                    model_option=model_option,
+                    stream=config.STREAM_ANSWERS,
+                    cancel_token=token
                 )
 
-                st.write(answer)
+                if isinstance(answer, str):
+                    st.write(answer)
+                else:
+                    # Render tokens as they arrive; write_stream returns the full text
+                    answer = st.write_stream(answer)
 
                 # Show metadata about the deep reasoning process
                 if metadata and source_type == "graph_multi_query":
@@ -153,7 +152,9 @@ def handle_user_input(mistral_api_key, model_option):
 
             except Exception as e:
                 error_msg = str(e)
-                if "429" in error_msg or "capacity" in error_msg.lower():
+                if isinstance(e, RequestCancelled):
+                    answer = "This question took too long to answer. Please try again or ask something more specific."
+                elif "429" in error_msg or "capacity" in error_msg.lower():
                     answer = "I'm experiencing high demand right now. Please wait a moment and try again."
                 else:
                     answer = "I apologize, but I encountered an error. Please try rephrasing your question."
@@ -161,6 +162,12 @@ def handle_user_input(mistral_api_key, model_option):
                 st.error(answer)
                 st.session_state.messages.append({"role": "assistant", "content": answer})
 
+        # Finished: nothing left to cancel on the next run
+        st.session_state.pop("cancel_token", None)
+
+        # Bound session memory: older turns live on as a summary
+        st.session_state.messages = trim_history(st.session_state.messages)
+
 
 def main():
     # Main application function
@@ -177,6 +184,13 @@ def main():
 
     # Initialize session state
     initialize_session_state()
+    cancel_abandoned_request()
+
+    # Open database connections up front; on failure the first question retries
+    try:
+        warm_up_neo4j()
+    except Exception as e:
+        logger.warning("Neo4j warm-up failed: %s", e)
 
     # Render sidebar and get configuration
     mistral_api_key, model_option = render_sidebar()
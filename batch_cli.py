@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from mistralai import Mistral
+import config
+from pipeline import process_query_with_deep_reasoning
+from response_generator import SYNTHESIS_FAILURE_MESSAGE, DIRECT_ANSWER_FAILURE_MESSAGE
+
+# Answers the pipeline returns when every model failed; recorded as errors so a resumed run retries them
+FAILURE_ANSWERS = (SYNTHESIS_FAILURE_MESSAGE, DIRECT_ANSWER_FAILURE_MESSAGE)
+
+
+def load_questions(path):
+    # Questions from JSONL: {"question": ..., optional "id", "history", "model"}; ids default to the line number
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not isinstance(item.get("question"), str) or not item["question"].strip():
+                raise ValueError(f"{path}:{line_number}: 'question' must be a non-empty string")
+            item.setdefault("id", line_number)
+            questions.append(item)
+    return questions
+
+
+def load_checkpoint(path):
+    # Ids already answered in an existing output file. A line cut off by an interruption is removed
+    # so appended results start on a fresh line; failed questions are not counted and run again.
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+
+    done = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "ok":
+            done.add(record["id"])
+    return done
+
+
+def answer_question(client, item, default_model):
+    # Run the pipeline for one question; returns the output record with per-phase timings in ms
+    timings = {}
+
+    @contextmanager
+    def status(phase, message):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[phase] = timings.get(phase, 0.0) + (time.perf_counter() - started) * 1000
+
+    question = item["question"]
+    history = list(item.get("history") or []) + [{"role": "user", "content": question}]
+    record = {"id": item["id"], "question": question}
+
+    started = time.perf_counter()
+    try:
+        answer, source_type, metadata = process_query_with_deep_reasoning(
+            client, question, conversation_history=history, model_option=item.get("model", default_model),
+            status=status
+        )
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    else:
+        # Direct answers carry the analysis (if any) as metadata, graph answers a metadata dict. The queries
+        # are the plan: some may have been refused by the guard, served from the neighborhood store or
+        # be subgraph expansions rather than Cypher.
+        graph = source_type == "graph_multi_query"
+        record.update(
+            status="ok",
+            answer=answer,
+            source_type=source_type,
+            analysis=metadata["analysis"] if graph else metadata,
+            planned_queries=metadata["queries"] if graph else [],
+            total_results=metadata["total_results"] if graph else 0
+        )
+        if answer in FAILURE_ANSWERS:
+            record.update(status="error", error="No model produced an answer")
+    timings["total"] = (time.perf_counter() - started) * 1000
+    record["timings_ms"] = {phase: round(ms, 3) for phase, ms in timings.items()}
+    return record
+
+
+def run_batch(client, questions, output_path, workers, default_model, progress=None):
+    # Answer questions on a worker pool, appending each record to output_path as soon as it is done.
+    # At most 2 * workers questions are in flight, so large corpora are not queued up front.
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "error": 0}
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        pending = set()
+        remaining = iter(questions)
+
+        def write(record):
+            with write_lock:
+                output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                output.flush()
+                counts[record["status"]] += 1
+            if progress:
+                progress(record, counts)
+
+        while True:
+            for item in remaining:
+                pending.add(executor.submit(answer_question, client, item, default_model))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                write(future.result())
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the reasoning pipeline")
+    parser.add_argument("input", help="JSONL with one {\"question\": ...} object per line")
+    parser.add_argument("output", help="JSONL results, appended as questions finish")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS,
+                        help="Questions processed concurrently (sharing the Neo4j pool and LLM rate limits)")
+    parser.add_argument("--model", default=config.AVAILABLE_MODELS[0], choices=config.AVAILABLE_MODELS)
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Answer every question again instead of skipping those already in the output")
+    args = parser.parse_args()
+
+    if not config.MISTRAL_API_KEY:
+        parser.error("MISTRAL_API_KEY is not set")
+
+    questions = load_questions(args.input)
+    if args.no_resume:
+        open(args.output, "w").close()
+    else:
+        done = load_checkpoint(args.output)
+        skipped = sum(1 for item in questions if item["id"] in done)
+        questions = [item for item in questions if item["id"] not in done]
+        if skipped:
+            print(f"Resuming: {skipped} questions already answered", file=sys.stderr)
+
+    total = len(questions)
+
+    def progress(record, counts):
+        finished = counts["ok"] + counts["error"]
+        print(f"[{finished}/{total}] {record['id']}: {record['status']} "
+              f"({record['timings_ms']['total'] / 1000:.1f}s)", file=sys.stderr)
+
+    client = Mistral(api_key=config.MISTRAL_API_KEY)
+    started = time.perf_counter()
+    counts = run_batch(client, questions, args.output, max(1, args.workers), args.model, progress)
+    print(f"Answered {counts['ok']} questions ({counts['error']} failed) in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    if counts["error"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import config
+import neo4j_client
+from benchmark_stubs import StubMistral, InMemoryGraphClient
+from pipeline import process_query_with_deep_reasoning, PHASES
+from query_classifier import classify_question
+from deep_analysis import deep_analysis_of_question
+from query_generator import generate_multiple_cypher_queries
+from query_executor import execute_multiple_queries
+from response_generator import synthesize_comprehensive_answer
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+
+def load_questions(path):
+    # Question corpus from JSONL ({"id": ..., "question": ...} per line)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def run_pipeline_once(client, question):
+    # Run the full pipeline, returning {phase: seconds} including "total"
+    timings = {}
+
+    @contextmanager
+    def status(phase, message):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+    started = time.perf_counter()
+    process_query_with_deep_reasoning(
+        client, question, conversation_history=[{"role": "user", "content": question}], status=status
+    )
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def run_stages_once(client, question):
+    # Call each stage module directly in sequence, returning {stage: seconds} including "total"
+    timings = {}
+    history = [{"role": "user", "content": question}]
+
+    def timed(stage, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - started
+        return result
+
+    started = time.perf_counter()
+    timed("classification", classify_question, client, question)
+    analysis = timed("analysis", deep_analysis_of_question, client, question, history)
+    if analysis["entities"]:
+        queries = timed("query_generation", generate_multiple_cypher_queries, client, question, analysis, history)
+        results = timed("query_execution", execute_multiple_queries, queries)
+        timed("synthesis", synthesize_comprehensive_answer, client, question, analysis, results, history)
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def measure_latency(client, questions, iterations, workers, runner):
+    # Run the corpus iterations times over a worker pool; returns (timings list, wall seconds)
+    workload = [question for _ in range(iterations) for question in questions]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        timings = list(executor.map(lambda question: runner(client, question), workload))
+    return timings, time.perf_counter() - started
+
+
+def measure_allocations(client, questions, runner):
+    # Peak traced memory and allocated blocks per question (sequential, tracemalloc adds overhead)
+    peaks = []
+    blocks = []
+    tracemalloc.start()
+    try:
+        for question in questions:
+            baseline_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            runner(client, question)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+            current_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+            blocks.append(current_blocks - baseline_blocks)
+    finally:
+        tracemalloc.stop()
+    return peaks, blocks
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(timings, wall_seconds, peaks, blocks, stub):
+    # Aggregate raw measurements into the benchmark report
+    phases = {}
+    for phase in PHASES + ("total",):
+        values = [t[phase] * 1000 for t in timings if phase in t]
+        if values:
+            phases[phase] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+                "mean_ms": sum(values) / len(values)
+            }
+
+    report = {
+        "phases": phases,
+        "questions": len(timings),
+        "wall_seconds": wall_seconds,
+        "throughput_qps": len(timings) / wall_seconds if wall_seconds else 0.0,
+        "llm_calls": dict(stub.calls)
+    }
+    if peaks:
+        report["allocations"] = {
+            "peak_kib_p50": percentile(peaks, 50) / 1024,
+            "peak_kib_max": max(peaks) / 1024,
+            "net_blocks_p50": percentile(blocks, 50)
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'phase':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for phase, stats in report["phases"].items():
+        print(f"{phase:<18}{stats['count']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['mean_ms']:>10.2f}")
+    print(f"\nthroughput: {report['throughput_qps']:.2f} questions/s "
+          f"({report['questions']} questions in {report['wall_seconds']:.2f}s)")
+    print(f"LLM calls by stage: {report['llm_calls']}")
+    if "allocations" in report:
+        alloc = report["allocations"]
+        print(f"allocations per question: peak p50 {alloc['peak_kib_p50']:.1f} KiB, "
+              f"peak max {alloc['peak_kib_max']:.1f} KiB, net blocks p50 {alloc['net_blocks_p50']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with stub Mistral and in-memory graph")
+    parser.add_argument("--questions", default=os.path.join(BENCHMARK_DIR, "questions.jsonl"))
+    parser.add_argument("--graph", default=os.path.join(BENCHMARK_DIR, "graph.json"))
+    parser.add_argument("--completions", default=os.path.join(BENCHMARK_DIR, "completions.json"))
+    parser.add_argument("--mode", choices=("pipeline", "stages"), default="pipeline",
+                        help="Drive process_query_with_deep_reasoning or each stage module directly")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Simulated latency per LLM call")
+    parser.add_argument("--llm-jitter-ms", type=float, default=10)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency-ms", type=float, default=2, help="Simulated latency per graph query")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--warm-cache", action="store_true", help="Keep LLM response caching enabled")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep client-side LLM rate limiting enabled")
+    parser.add_argument("--no-alloc", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    # Measure the uncached, unthrottled pipeline unless asked otherwise
+    config.LLM_CACHE_ENABLED = args.warm_cache
+    config.LLM_RATE_LIMIT_ENABLED = args.rate_limit
+    config.NEIGHBORHOOD_STORE_ENABLED = args.warm_cache
+
+    stub = StubMistral.from_file(
+        args.completions,
+        latency_ms={"default": args.llm_latency_ms},
+        jitter_ms=args.llm_jitter_ms,
+        error_rate=args.llm_error_rate
+    )
+    neo4j_client.set_neo4j_client(InMemoryGraphClient.from_file(args.graph, latency_ms=args.db_latency_ms))
+
+    runner = run_pipeline_once if args.mode == "pipeline" else run_stages_once
+    questions = load_questions(args.questions)
+
+    timings, wall_seconds = measure_latency(stub, questions, args.iterations, args.workers, runner)
+    peaks, blocks = ([], []) if args.no_alloc else measure_allocations(stub, questions, runner)
+
+    report = summarize(timings, wall_seconds, peaks, blocks, stub)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from neo4j_client import normalize_cypher
+from instrumentation import record_query
+from triplet import Triplet
+
+# Markers identifying which pipeline stage a prompt belongs to
+STAGE_MARKERS = [
+    ("classification", "Analyze this user question and classify it"),
+    ("analysis", "Classify this question and, if it needs the knowledge graph"),
+    ("analysis", "Perform a DEEP ANALYSIS of this question"),
+    ("query_generation", "You are a Neo4j Cypher expert"),
+    ("synthesis", "Synthesize a CONCISE, CLEAR answer"),
+    ("direct_answer", "knowledgeable and empathetic medical assistant")
+]
+
+
+class StubMistral:
+    # Stand-in for the Mistral client replaying recorded completions with simulated latency.
+    # Recordings map stage -> {"default": text, "by_question": {question: text}}.
+
+    def __init__(self, recordings, latency_ms=None, jitter_ms=0, error_rate=0.0, seed=0):
+        self.recordings = recordings
+        self.latency_ms = latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(complete=self.complete, stream=self.stream)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def complete(self, model, messages, temperature=None, **kwargs):
+        content = self._reply(messages)
+        prompt_tokens = sum(len(str(msg.get("content", ""))) for msg in messages) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=len(content) // 4,
+                total_tokens=prompt_tokens + len(content) // 4
+            )
+        )
+
+    def stream(self, model, messages, temperature=None, **kwargs):
+        content = self._reply(messages)
+        for start in range(0, len(content), 16):
+            delta = SimpleNamespace(content=content[start:start + 16])
+            yield SimpleNamespace(data=SimpleNamespace(choices=[SimpleNamespace(delta=delta)]))
+
+    def _reply(self, messages):
+        # Recorded completion for the prompt's stage and question, after the simulated latency
+        prompt = messages[0]["content"]
+        stage = _detect_stage(prompt)
+
+        with self._lock:
+            self.calls[stage] += 1
+            fail = self._random.random() < self.error_rate
+            delay = self.latency_ms.get(stage, self.latency_ms.get("default", 0))
+            delay += self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            raise Exception("Stub error (429 simulated)")
+
+        recording = self.recordings.get(stage, {})
+        for question, text in recording.get("by_question", {}).items():
+            if question in prompt:
+                return text
+        return recording.get("default", "")
+
+
+class InMemoryGraphClient:
+    # Stand-in for Neo4jClient over a fixture graph with the (Source)-[TO {type}]->(Destination) schema.
+    # Understands MATCH/WHERE/RETURN/LIMIT queries built from CONTAINS, AND, OR and NOT predicates,
+    # which covers the generated query templates.
+
+    def __init__(self, triplets, latency_ms=0):
+        self.triplets = [
+            (source, relation, destination, source.lower(), relation.lower(), destination.lower())
+            for source, relation, destination in triplets
+        ]
+        self.latency_ms = latency_ms
+        self.cache = None
+        self._predicates = {}
+        self._query_shapes = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["triplets"], **kwargs)
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def test_connection(self):
+        return True
+
+    def execute_query(self, cypher_query, parameters=None):
+        # Evaluate the query over the fixture triplets, returning Triplets like Neo4jClient
+        started = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        with self._lock:
+            self._query_shapes[normalize_cypher(cypher_query)] += 1
+            compiled = self._predicates.get(cypher_query)
+            if compiled is None:
+                compiled = self._predicates[cypher_query] = _compile_query(cypher_query)
+
+        predicate, limit = compiled
+        params = parameters or {}
+        if isinstance(limit, str):
+            limit = int(params[limit])
+
+        triplets = []
+        for source, relation, destination, n_name, r_type, m_name in self.triplets:
+            if predicate(n_name, r_type, m_name, params):
+                triplets.append(Triplet(source, relation, destination))
+                if limit is not None and len(triplets) >= limit:
+                    break
+
+        record_query(len(triplets), time.perf_counter() - started)
+        return triplets
+
+    def find_nodes(self, term, limit):
+        # Like Neo4jClient.find_nodes: one round trip of simulated latency
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        names = {name for source, _, destination, n_name, _, m_name in self.triplets
+                 for name, lower in ((source, n_name), (destination, m_name)) if term in lower}
+        return sorted(names, key=lambda name: (name.lower() != term, len(name), name))[:limit]
+
+    def expand_frontier(self, names, relations, fanout):
+        # Like Neo4jClient.expand_frontier: edges of each named node in either direction, at most fanout each
+        started = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        triplets = []
+        for name in names:
+            count = 0
+            for source, relation, destination, _, r_type, _ in self.triplets:
+                if count >= fanout:
+                    break
+                if name in (source, destination) and (not relations or any(term in r_type for term in relations)):
+                    triplets.append(Triplet(source, relation, destination))
+                    count += 1
+        record_query(len(triplets), time.perf_counter() - started)
+        return triplets
+
+    def iter_triplets(self):
+        for source, relation, destination, *_ in self.triplets:
+            yield source, relation, destination
+
+    def fetch_entity_names(self):
+        names = set()
+        for source, _, destination, *_ in self.triplets:
+            names.add(source)
+            names.add(destination)
+        return sorted(names)
+
+    def invalidate_cache(self):
+        pass
+
+    def cache_stats(self):
+        return None
+
+    def query_shape_stats(self, top=10):
+        with self._lock:
+            return {
+                "distinct_shapes": len(self._query_shapes),
+                "executions": sum(self._query_shapes.values()),
+                "most_common": self._query_shapes.most_common(top)
+            }
+
+
+_PATTERN = re.compile(
+    r"MATCH\s*\((\w+)(?::Source)?\)\s*-\s*\[(\w+)(?::TO)?\]\s*->\s*\((\w+)(?::Destination)?\)", re.IGNORECASE
+)
+_WHERE = re.compile(r"\bWHERE\b(.*?)\bRETURN\b", re.IGNORECASE | re.DOTALL)
+_LIMIT = re.compile(r"\bLIMIT\s+(\d+|\$\w+)", re.IGNORECASE)
+# Tokens of a WHERE clause: string literals, parameters, [toLower(]variable.property[)], parentheses and keywords
+_TOKEN = re.compile(
+    r"\s*('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\$\w+|toLower\(\s*\w+\.\w+\s*\)|\w+\.\w+|[()]|\w+)",
+    re.IGNORECASE
+)
+_FIELD = re.compile(r"(?:toLower\(\s*)?(\w+)\.\w+\s*\)?", re.IGNORECASE)
+
+
+def _compile_query(cypher_query):
+    # Translate a template-style query into (predicate(n_name, r_type, m_name, params), limit)
+    pattern = _PATTERN.search(cypher_query)
+    if not pattern:
+        raise Exception("Unsupported query for in-memory graph")
+    variables = {pattern.group(1): 0, pattern.group(2): 1, pattern.group(3): 2}
+
+    where = _WHERE.search(cypher_query)
+    if where:
+        condition = _WhereParser(where.group(1), variables).parse()
+        predicate = lambda n_name, r_type, m_name, params: condition((n_name, r_type, m_name), params)
+    else:
+        predicate = lambda n_name, r_type, m_name, params: True
+
+    limit = _LIMIT.search(cypher_query)
+    if limit is None:
+        limit_value = None
+    elif limit.group(1).startswith("$"):
+        limit_value = limit.group(1)[1:]
+    else:
+        limit_value = int(limit.group(1))
+
+    return predicate, limit_value
+
+
+class _WhereParser:
+    # Recursive-descent parser for the WHERE clauses of the generated queries: CONTAINS comparisons
+    # combined with AND, OR, NOT and parentheses. Builds a condition(row, params) over the lowercase
+    # (n.name, r.type, m.name) of a triplet.
+
+    def __init__(self, text, variables):
+        self.tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if not match:
+                raise Exception(f"Unsupported condition: {text[position:]}")
+            self.tokens.append(match.group(1))
+            position = match.end()
+        self.position = 0
+        self.variables = variables
+
+    def parse(self):
+        condition = self._or()
+        if self.position < len(self.tokens):
+            raise Exception(f"Unsupported condition near: {self.tokens[self.position]}")
+        return condition
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise Exception("Incomplete condition")
+        self.position += 1
+        return token
+
+    def _accept(self, keyword):
+        token = self._peek()
+        if token is not None and token.upper() == keyword:
+            self.position += 1
+            return True
+        return False
+
+    def _or(self):
+        conditions = [self._and()]
+        while self._accept("OR"):
+            conditions.append(self._and())
+        if len(conditions) == 1:
+            return conditions[0]
+        return lambda row, params: any(condition(row, params) for condition in conditions)
+
+    def _and(self):
+        conditions = [self._not()]
+        while self._accept("AND"):
+            conditions.append(self._not())
+        if len(conditions) == 1:
+            return conditions[0]
+        return lambda row, params: all(condition(row, params) for condition in conditions)
+
+    def _not(self):
+        if self._accept("NOT"):
+            condition = self._not()
+            return lambda row, params: not condition(row, params)
+        return self._primary()
+
+    def _primary(self):
+        if self._accept("("):
+            condition = self._or()
+            if not self._accept(")"):
+                raise Exception("Unbalanced parentheses in condition")
+            return condition
+        if self._accept("TRUE"):
+            return lambda row, params: True
+        if self._accept("FALSE"):
+            return lambda row, params: False
+
+        haystack = self._operand()
+        if not self._accept("CONTAINS"):
+            raise Exception(f"Unsupported comparison near: {self._peek()}")
+        needle = self._operand()
+        return lambda row, params: needle(row, params) in haystack(row, params)
+
+    def _operand(self):
+        # Value getter: parameter, lowercased string literal, or the lowercase property of a pattern variable
+        token = self._next()
+        if token.startswith("$"):
+            name = token[1:]
+            return lambda row, params: params[name]
+        if token[0] in "'\"":
+            value = re.sub(r"\\(.)", r"\1", token[1:-1]).lower()
+            return lambda row, params: value
+        match = _FIELD.fullmatch(token)
+        if not match or match.group(1) not in self.variables:
+            raise Exception(f"Unsupported operand: {token}")
+        index = self.variables[match.group(1)]
+        return lambda row, params: row[index]
+
+
+def _detect_stage(prompt):
+    # Pipeline stage of a prompt, from its fixed wording
+    for stage, marker in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return "default"
@@ -0,0 +1,25 @@
+import argparse
+import config
+from neo4j_client import Neo4jClient
+
+def main():
+    # Provision the name_lower property and text indexes used when USE_NAME_LOWER_INDEX is enabled
+    parser = argparse.ArgumentParser(description="Create lowercase name indexes on Source and Destination nodes")
+    parser.add_argument("--batch-size", type=int, default=config.SCHEMA_BOOTSTRAP_BATCH_SIZE,
+                        help="Nodes updated per transaction")
+    args = parser.parse_args()
+
+    client = Neo4jClient()
+    client.connect()
+    try:
+        updated = client.bootstrap_schema(batch_size=args.batch_size)
+    finally:
+        client.close()
+
+    for label, count in updated.items():
+        print(f"{label}: name_lower set on {count} nodes, text index ready")
+    print("Set USE_NAME_LOWER_INDEX=true to let the executor use the indexes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryTier:
+    # In-process LRU tier bounded by number of entries
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        # Return (found, value, expires_at) and mark the entry as recently used
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None, None
+            self._entries.move_to_end(key)
+            value, expires_at = entry
+            return True, value, expires_at
+
+    def set(self, key, value, expires_at):
+        # Store value, evicting least recently used entries above the size bound
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    # On-disk tier that survives process restarts; values are stored as JSON
+
+    def __init__(self, path, namespace="cache"):
+        self.path = path
+        self.table = f"{namespace}_entries"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get(self, key):
+        # Return (found, value, expires_at)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return False, None, None
+        return True, json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self):
+        # Remove expired rows so the database file does not grow without bound
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TieredCache:
+    # Two-tier cache (memory LRU in front of an optional SQLite tier) with TTL expiry
+
+    def __init__(self, max_entries=512, ttl_seconds=None, db_path=None, namespace="cache"):
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryTier(max_entries)
+        self.disk = SQLiteTier(db_path, namespace) if db_path else None
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        if self.disk is not None:
+            self.disk.purge_expired()
+
+    def get(self, key):
+        # Return (found, value); disk hits are promoted to the memory tier
+        now = time.time()
+
+        found, value, expires_at = self.memory.get(key)
+        if found:
+            if expires_at is None or expires_at > now:
+                self._count("memory_hits")
+                return True, value
+            self.memory.delete(key)
+            self._count("expirations")
+
+        if self.disk is not None:
+            found, value, expires_at = self.disk.get(key)
+            if found:
+                if expires_at is None or expires_at > now:
+                    self.memory.set(key, value, expires_at)
+                    self._count("disk_hits")
+                    return True, value
+                self.disk.delete(key)
+                self._count("expirations")
+
+        self._count("misses")
+        return False, None
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.time() + ttl if ttl else None
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at)
+
+    def invalidate(self, key=None):
+        # Drop a single key, or every entry in both tiers when key is None
+        if key is None:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+        else:
+            self.memory.delete(key)
+            if self.disk is not None:
+                self.disk.delete(key)
+
+    def stats(self):
+        # Hit/miss counters used to size the cache
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.memory.evictions,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0
+        }
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
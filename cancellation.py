@@ -0,0 +1,123 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from instrumentation import metrics
+
+# Cancellation token of the request being processed in the current context
+_current_token = contextvars.ContextVar("cancellation_token", default=None)
+
+
+class RequestCancelled(Exception):
+    # Raised inside a request whose token was cancelled or whose deadline passed
+    def __init__(self, reason):
+        super().__init__(f"Request {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    # Request-scoped cancellation flag with an optional deadline. Stages check it between steps and
+    # bound their own timeouts (Neo4j transactions, LLM calls, waits) by the time remaining.
+
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        # Cancel the request; sleeps in cancellation.sleep wake up immediately
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            metrics.inc("requests_cancelled_total", help_text="Requests cancelled or past their deadline",
+                        reason=reason)
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("timed_out")
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled(self.reason)
+
+    def wait(self, seconds):
+        # Sleep up to seconds (never past the deadline); True if the request got cancelled meanwhile
+        remaining = self.remaining()
+        self._event.wait(seconds if remaining is None else min(seconds, remaining))
+        return self.cancelled
+
+    def remaining(self):
+        # Seconds until the deadline (None without one)
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+@contextmanager
+def cancellation_scope(token):
+    # Make token the current one; worker threads started through bind_context inherit it
+    context_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(context_token)
+
+
+def current_token():
+    return _current_token.get()
+
+
+def check_cancelled():
+    # Raise RequestCancelled if the current request was cancelled
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def is_cancelled():
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+
+def time_left(timeout):
+    # timeout, shortened to the current request's remaining time; raises if it was cancelled
+    token = _current_token.get()
+    if token is None:
+        return timeout
+    token.check()
+    remaining = token.remaining()
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def sleep(seconds):
+    # time.sleep that returns early (raising RequestCancelled) when the current request is cancelled
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    if token.wait(seconds):
+        raise RequestCancelled(token.reason)
+
+
+def iterate_in_scope(token, iterator):
+    # Consume a (streaming) iterator with token current at every step, e.g. after the request returned it
+    with cancellation_scope(token):
+        iterator = iter(iterator)
+    try:
+        while True:
+            with cancellation_scope(token):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        # Abandoned by the consumer: close the source (and its HTTP stream) now
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            with cancellation_scope(token):
+                close()
@@ -9,6 +9,15 @@ NEO4J_URI = os.getenv("NEO4J_URI", "URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME", "USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "PASSWORD")
 
+# Neo4j Connection Pool
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = 10  # seconds to wait for a free pooled connection
+NEO4J_MAX_CONNECTION_LIFETIME = 3600  # recycle connections before servers/proxies drop them
+NEO4J_LIVENESS_CHECK_TIMEOUT = 30  # idle connections older than this are checked before reuse
+NEO4J_CONNECTION_TIMEOUT = 5
+NEO4J_WARM_UP_CONNECTIONS = 4  # connections opened at startup (matches QUERY_EXECUTION_WORKERS)
+NEO4J_HEALTH_CHECK_INTERVAL = 30  # seconds between liveness checks; 0 disables the monitor
+
 # Mistral AI Configuration
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
 
@@ -23,14 +32,156 @@ AVAILABLE_MODELS = [
 # Default models to try in auto mode
 DEFAULT_MODELS = ["open-mistral-7b", "open-mistral-8x7b", "mistral-small-latest"]
 
+# Pipeline Settings
+FUSED_ANALYSIS_MODE = False  # classify and analyze questions in a single LLM call
+STREAM_ANSWERS = True  # render answers token by token in the Streamlit UI
+USE_CYPHER_COMPILER = True  # build template queries locally, LLM generation only as fallback
+SPECULATIVE_PREFETCH = True  # start likely graph queries while the LLM stages run
+SPECULATIVE_PREFETCH_MAX_QUERIES = 4
+
+# Entity Gazetteer Settings
+GAZETTEER_ENABLED = True  # drop analysis entities that do not exist in the graph
+GAZETTEER_SHORTCUT_ANALYSIS = False  # skip classification/analysis LLM calls when known entities are found
+GAZETTEER_MIN_NAME_LENGTH = 2
+GAZETTEER_RETRY_SECONDS = 60  # after a failed build, requests skip the gazetteer this long
+ENTITY_ALIASES = {
+    "HER-2": "HER2",
+    "ERBB2": "HER2",
+    "p53": "TP53",
+    "ER alpha": "ESR1",
+    "estrogen receptor alpha": "ESR1",
+    "Nolvadex": "Tamoxifen",
+    "Herceptin": "Trastuzumab"
+}
+
+# HTTP API Settings (api_server.py)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_MAX_CONCURRENCY = 8
+API_REQUEST_TIMEOUT = 60  # seconds
+API_MAX_BODY_BYTES = 64 * 1024
+
+# Batch CLI Settings (batch_cli.py)
+BATCH_WORKERS = 4  # questions answered concurrently
+
+# Instrumentation
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")  # JSON trace per request; empty logs traces at debug level
+
+# Model Routing (circuit breakers and backoff between fallback models)
+LLM_CIRCUIT_FAILURE_THRESHOLD = 3  # consecutive failures before a model is skipped
+LLM_CIRCUIT_OPEN_SECONDS = 30  # also used for 429s without Retry-After
+LLM_CIRCUIT_MAX_OPEN_SECONDS = 300
+LLM_ROUTER_SMOOTHING = 0.3  # EWMA weight of the latest latency/error sample
+LLM_ROUTER_ERROR_PENALTY = 4  # how strongly recent errors demote a model
+LLM_BACKOFF_BASE_SECONDS = 0.25
+LLM_BACKOFF_MAX_SECONDS = 4
+
+# Client-side Rate Limiting (per process, shared by all sessions)
+LLM_RATE_LIMIT_ENABLED = True
+MODEL_RATE_LIMITS = {
+    # model -> budgets; "default" applies to models not listed. Set a model to None to disable its limit.
+    "default": {"requests_per_minute": 60, "tokens_per_minute": 500000},
+}
+LLM_RATE_LIMIT_BURST_SECONDS = 5  # bucket capacity, in seconds of budget
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = 20  # longer queues fail over to the next model instead
+LLM_RATE_LIMIT_COMPLETION_TOKENS = 400  # completion size assumed until the response reports usage
+LLM_COALESCE_REQUESTS = True  # identical in-flight requests share one upstream call
+
 # Query Limits
 MAX_QUERY_RESULTS = 15
 MAX_TRIPLETS_FOR_SYNTHESIS = 20
 MAX_QUERIES_PER_QUESTION = 4
 
+# Triplet Ranking (selects the triplets passed to synthesis)
+TRIPLET_RANKING_ENABLED = True  # False keeps the first MAX_TRIPLETS_FOR_SYNTHESIS in query order
+TRIPLET_RANK_TOP_K = 12  # ranked triplets passed to synthesis (fewer, better-chosen facts)
+TRIPLET_RANK_WEIGHTS = {
+    "entity": 3.0,  # best endpoint match against the question's entities
+    "entity_pair": 2.0,  # both endpoints match (edge between two entities)
+    "relation": 1.5,  # relation type matches relationships_to_explore
+    "support": 1.0,  # per additional query that returned the triplet
+    "degree": 0.5  # endpoint degree within the retrieved subgraph (normalized)
+}
+TRIPLET_RANK_MAX_PER_RELATION = 4  # diversify across relation types
+
+# Query Execution Settings
+CONCURRENT_QUERY_EXECUTION = True
+QUERY_EXECUTION_WORKERS = 4
+QUERY_EXECUTION_TIMEOUT = 10  # seconds a query may run before its results are dropped
+
+# Cypher Guard (static checks before a query reaches the database)
+CYPHER_GUARD_ENABLED = True
+CYPHER_ALLOWED_PROCEDURES = ("db.labels", "db.relationshipTypes", "db.propertyKeys")
+CYPHER_MAX_PATH_HOPS = 3  # longest variable-length relationship allowed; unbounded ones are rejected
+CYPHER_REJECT_CARTESIAN = True  # refuse MATCH clauses with disconnected comma-separated patterns
+CYPHER_EXPLAIN_MAX_ROWS = int(os.getenv("CYPHER_EXPLAIN_MAX_ROWS", "0"))  # planner row estimate limit; 0 skips EXPLAIN
+CYPHER_GUARD_CACHE_SIZE = 1024
+
+# Subgraph Expansion (bounded bidirectional BFS between the entities of a question)
+SUBGRAPH_EXPANSION_ENABLED = True  # connect entity pairs by multi-hop paths instead of direct edges only
+SUBGRAPH_MAX_HOPS = 3  # longest path searched
+SUBGRAPH_FANOUT = 25  # edges followed per node and hop
+SUBGRAPH_MAX_FRONTIER = 100  # nodes expanded per hop
+SUBGRAPH_MAX_SEEDS = 3  # graph nodes a search starts from per entity
+SUBGRAPH_MAX_PATHS = 5  # paths returned per entity pair
+
+# Timeouts and Cancellation (bounded further by the remaining time of the request)
+NEO4J_TRANSACTION_TIMEOUT = QUERY_EXECUTION_TIMEOUT  # seconds; the server aborts longer transactions
+LLM_REQUEST_TIMEOUT = 30  # seconds per Mistral API call
+UI_REQUEST_TIMEOUT = 120  # seconds a Streamlit question may take before it is cancelled
+
+# Neighborhood Store (precomputed single-entity explorations of popular entities)
+NEIGHBORHOOD_STORE_ENABLED = True
+NEIGHBORHOOD_STORE_PATH = os.getenv("NEIGHBORHOOD_STORE_PATH", ".cache/neighborhoods.json.gz")
+HOT_ENTITIES = ["HER2", "BRCA1", "TP53", "ESR1", "Tamoxifen"]
+NEIGHBORHOOD_STORE_MAX_ENTITIES = 50  # hot entities plus the most requested ones
+NEIGHBORHOOD_STORE_TOP_K = MAX_QUERY_RESULTS  # triplets stored per entity
+NEIGHBORHOOD_STORE_MAX_TRACKED = 10000  # distinct requested entities counted for popularity
+NEIGHBORHOOD_STORE_REFRESH_SECONDS = 3600
+
+# Graph Snapshot (export with graph_snapshot.py; when set, template queries run in-process)
+GRAPH_SNAPSHOT_PATH = os.getenv("GRAPH_SNAPSHOT_PATH", "")
+GRAPH_SNAPSHOT_MATCH_CACHE_SIZE = 4096  # memoized entity term -> node ids lookups
+
+# Name Index Settings (run bootstrap_schema.py before enabling the rewrite)
+USE_NAME_LOWER_INDEX = os.getenv("USE_NAME_LOWER_INDEX", "false").lower() == "true"
+SCHEMA_BOOTSTRAP_BATCH_SIZE = 10000
+
+# Query Result Cache
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_MAX_ENTRIES = 512
+QUERY_CACHE_TTL_SECONDS = 3600
+QUERY_CACHE_DB_PATH = os.getenv("QUERY_CACHE_DB_PATH", "")  # empty disables the on-disk tier
+
+# LLM Response Cache
+LLM_CACHE_ENABLED = True
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # "memory" or "disk"
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", ".cache/llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = 1024
+LLM_CACHE_TTL_SECONDS = 24 * 3600
+LLM_CACHE_STAGES = {
+    "classification": True,
+    "analysis": True,
+    "query_generation": True,
+    "synthesis": True,
+    "direct_answer": False
+}
+
 # Conversation Settings
 MAX_CONVERSATION_HISTORY = 6
 RECENT_MESSAGES_FOR_CONTEXT = 4
+CONVERSATION_CONTEXT_BUDGETS = {
+    # messages: newest messages considered; tokens: budget of the whole block (recent messages first,
+    # then a summary of older turns); message_tokens: cap per message
+    "analysis": {"messages": RECENT_MESSAGES_FOR_CONTEXT, "tokens": 250, "message_tokens": 50},
+    "query_generation": {"messages": RECENT_MESSAGES_FOR_CONTEXT, "tokens": 250, "message_tokens": 50},
+    "synthesis": {"messages": RECENT_MESSAGES_FOR_CONTEXT, "tokens": 250, "message_tokens": 50},
+    "direct_answer": {"messages": MAX_CONVERSATION_HISTORY, "tokens": 600, "message_tokens": 75}
+}
+CONVERSATION_SUMMARY_TOKENS = 150  # rolling summary of turns older than a stage's window
+CONVERSATION_SUMMARY_LINE_TOKENS = 30
+CONVERSATION_MAX_SESSION_MESSAGES = 40  # older messages are folded into a summary message
+CONVERSATION_CONTEXT_CACHE_SIZE = 512
 
 # Temperature Settings
 CLASSIFICATION_TEMPERATURE = 0
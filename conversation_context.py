@@ -0,0 +1,153 @@
+import re
+import threading
+from collections import OrderedDict
+import config
+
+# Prompt layout per stage: (header, capitalize roles, trailing text)
+STAGE_FORMATS = {
+    "analysis": ("Recent conversation context:\n", False, "\n"),
+    "query_generation": ("Recent conversation:\n", False, "\n"),
+    "synthesis": ("\n\nPrevious conversation:\n", True, ""),
+    "direct_answer": ("\n\nConversation history:\n", True, "")
+}
+
+# Role of the message trim_history puts in front of the kept messages
+SUMMARY_ROLE = "summary"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def build_conversation_context(conversation_history, stage):
+    # Context block for a stage prompt: the newest messages that fit the stage's token budget, preceded
+    # by a rolling summary of older turns. Rendered once per stage and conversation state.
+    if not conversation_history or len(conversation_history) <= 1:
+        return ""
+
+    messages = tuple((msg['role'], msg['content']) for msg in conversation_history)
+    key = (stage, messages)
+    with _lock:
+        context = _rendered.get(key)
+        if context is not None:
+            _rendered.move_to_end(key)
+            return context
+
+    context = _render(messages, stage)
+
+    with _lock:
+        _rendered[key] = context
+        if len(_rendered) > config.CONVERSATION_CONTEXT_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return context
+
+
+def trim_history(conversation_history, max_messages=None):
+    # Cap stored history: messages beyond max_messages are folded into a leading summary message
+    max_messages = max_messages or config.CONVERSATION_MAX_SESSION_MESSAGES
+    if len(conversation_history) <= max_messages:
+        return conversation_history
+
+    dropped = tuple((msg['role'], msg['content']) for msg in conversation_history[:-max_messages])
+    summary = _summarize(dropped)
+    kept = list(conversation_history[-max_messages:])
+    return [{"role": SUMMARY_ROLE, "content": "\n".join(summary)}] + kept
+
+
+def count_tokens(text):
+    # Rough token count (about 4 characters per token), as used for rate limiting
+    return (len(text) + 3) // 4
+
+
+def _render(messages, stage):
+    header, title_roles, trailer = STAGE_FORMATS[stage]
+    budget = config.CONVERSATION_CONTEXT_BUDGETS[stage]
+
+    window = budget["messages"]
+    recent = [message for message in messages[-window:] if message[0] != SUMMARY_ROLE]
+    older = messages[:-window] if len(messages) > window else ()
+
+    # Newest messages first until the budget is used up
+    remaining = budget["tokens"]
+    lines = []
+    for role, content in reversed(recent):
+        line = f"{role.title() if title_roles else role}: {_truncate(content, budget['message_tokens'])}\n"
+        cost = count_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+
+    # Summary of older turns in what is left, newest summary lines first
+    summary_lines = []
+    for line in reversed(_summarize(older)):
+        cost = count_tokens(line) + 1
+        if cost > remaining:
+            break
+        summary_lines.append(line)
+        remaining -= cost
+    if summary_lines:
+        summary_lines.reverse()
+        lines.insert(0, "Earlier: " + " | ".join(summary_lines) + "\n")
+
+    return header + "".join(lines) + trailer
+
+
+def _summarize(messages):
+    # Rolling extractive summary (tuple of lines) of a message prefix, extended one message at a time
+    # from the longest already summarized prefix
+    if not messages:
+        return ()
+
+    with _lock:
+        start = len(messages)
+        summary = None
+        while start > 0:
+            summary = _summaries.get(messages[:start])
+            if summary is not None:
+                _summaries.move_to_end(messages[:start])
+                break
+            start -= 1
+
+    if summary is None:
+        summary = ()
+    new_entries = []
+    for end in range(start + 1, len(messages) + 1):
+        summary = _fold(summary, messages[end - 1])
+        new_entries.append((messages[:end], summary))
+
+    with _lock:
+        for prefix, prefix_summary in new_entries:
+            _summaries[prefix] = prefix_summary
+        while len(_summaries) > config.CONVERSATION_CONTEXT_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    return summary
+
+
+def _fold(summary, message):
+    # Add one message to the summary, dropping the oldest lines beyond CONVERSATION_SUMMARY_TOKENS
+    role, content = message
+    if role == SUMMARY_ROLE:
+        lines = list(summary) + [line for line in content.split("\n") if line]
+    else:
+        first_sentence = _SENTENCE_END.split(content.strip(), 1)[0]
+        lines = list(summary) + [f"{role}: {_truncate(first_sentence, config.CONVERSATION_SUMMARY_LINE_TOKENS)}"]
+
+    while lines and sum(count_tokens(line) for line in lines) > config.CONVERSATION_SUMMARY_TOKENS:
+        lines.pop(0)
+    return tuple(lines)
+
+
+def _truncate(text, max_tokens):
+    # Shorten text to about max_tokens, cutting at a word boundary
+    text = " ".join(text.split())
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + "..."
+
+
+# Rendered contexts and prefix summaries, shared by all conversations
+_rendered = OrderedDict()
+_summaries = OrderedDict()
+_lock = threading.Lock()
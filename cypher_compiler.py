@@ -0,0 +1,113 @@
+from itertools import zip_longest
+import config
+
+# The three parameterized query templates, also described to the LLM in query_generator.
+# Query text never changes between questions, so the server can reuse cached plans.
+SINGLE_ENTITY_TEMPLATE = """MATCH (n:Source)-[r:TO]->(m:Destination)
+WHERE toLower(n.name) CONTAINS $entity OR toLower(m.name) CONTAINS $entity
+RETURN n, r, m
+LIMIT $limit"""
+
+TWO_ENTITY_TEMPLATE = """MATCH (n:Source)-[r:TO]->(m:Destination)
+WHERE (toLower(n.name) CONTAINS $entity1 AND toLower(m.name) CONTAINS $entity2)
+   OR (toLower(n.name) CONTAINS $entity2 AND toLower(m.name) CONTAINS $entity1)
+RETURN n, r, m
+LIMIT $limit"""
+
+RELATIONSHIP_TEMPLATE = """MATCH (n:Source)-[r:TO]->(m:Destination)
+WHERE toLower(n.name) CONTAINS $entity AND toLower(r.type) CONTAINS $relationship
+RETURN n, r, m
+LIMIT $limit"""
+
+
+def compile_queries(analysis, max_queries=None):
+    # Compile deep-analysis JSON into template queries; None if the analysis cannot be handled locally
+    max_queries = max_queries or config.MAX_QUERIES_PER_QUESTION
+
+    entities = _clean_terms(analysis.get("entities", []))
+    if not entities:
+        return None
+
+    relationships = _clean_terms(analysis.get("relationships_to_explore", []))
+
+    # Interactions between the main entity and each other entity: multi-hop paths when subgraph
+    # expansion is enabled (direct edges are the one-hop paths), otherwise direct edges
+    interactions = expansion_queries(analysis)
+    if not interactions and len(entities) > 1 and analysis.get("query_strategy") != "single_entity":
+        main_name, main_term = entities[0]
+        for name, term in entities[1:]:
+            interactions.append({
+                "purpose": f"Interaction between {main_name} and {name}",
+                "cypher": TWO_ENTITY_TEMPLATE,
+                "params": {"entity1": main_term, "entity2": term, "limit": config.MAX_QUERY_RESULTS}
+            })
+
+    # Bidirectional exploration of every entity
+    explorations = exploration_queries(analysis.get("entities", []))
+
+    # Relationship types of interest for the main entity
+    main_name, main_term = entities[0]
+    relationship_queries = [
+        {
+            "purpose": f"{main_name} relationships of type '{relationship_name}'",
+            "cypher": RELATIONSHIP_TEMPLATE,
+            "params": {"entity": main_term, "relationship": relationship_term, "limit": config.MAX_QUERY_RESULTS}
+        }
+        for relationship_name, relationship_term in relationships
+    ]
+
+    # Interleave the kinds before truncating, so many entities cannot crowd out the explorations
+    queries = [
+        query for group in zip_longest(interactions, explorations, relationship_queries)
+        for query in group if query is not None
+    ]
+    return queries[:max_queries]
+
+
+def exploration_queries(entities):
+    # Single-entity explorations (both directions) of the given entity names
+    return [
+        {
+            "purpose": f"All relationships of {name}",
+            "cypher": SINGLE_ENTITY_TEMPLATE,
+            "params": {"entity": term, "limit": config.MAX_QUERY_RESULTS}
+        }
+        for name, term in _clean_terms(entities)
+    ]
+
+
+def expansion_queries(analysis):
+    # "expand" query objects connecting the main entity to each other entity (executed by
+    # subgraph_expander, not as Cypher); empty for single-entity analyses or when disabled
+    if not config.SUBGRAPH_EXPANSION_ENABLED or analysis.get("query_strategy") == "single_entity":
+        return []
+    entities = _clean_terms(analysis.get("entities", []))
+    if len(entities) < 2:
+        return []
+
+    relations = [term for _, term in _clean_terms(analysis.get("relationships_to_explore", []))]
+    main_name, main_term = entities[0]
+    return [
+        {
+            "purpose": f"Paths connecting {main_name} and {name}",
+            "expand": {"source": main_term, "target": term, "relations": relations,
+                       "max_hops": config.SUBGRAPH_MAX_HOPS, "fanout": config.SUBGRAPH_FANOUT}
+        }
+        for name, term in entities[1:]
+    ]
+
+
+def _clean_terms(values):
+    # Return unique (display name, lowercase search term) pairs, skipping empty values
+    terms = []
+    seen = set()
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        name = value.strip()
+        term = name.lower()
+        if term and term not in seen:
+            seen.add(term)
+            terms.append((name, term))
+    return terms
+
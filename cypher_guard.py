@@ -0,0 +1,263 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+import config
+from instrumentation import metrics
+
+# Clauses that modify data or schema, and administration commands
+WRITE_CLAUSES = ("CREATE", "MERGE", "DELETE", "DETACH", "SET", "REMOVE", "DROP", "FOREACH", r"LOAD\s+CSV")
+ADMIN_COMMANDS = ("ALTER", "GRANT", "DENY", "REVOKE", "SHOW", "TERMINATE", "START", "STOP", "USE")
+
+# String literals, backquoted names and comments; masked before the query text is inspected
+_MASKED = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|//[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def _keyword(*words):
+    # Keyword that is not part of a property, parameter or label name
+    return re.compile(rf"(?<![\w.$:])(?:{'|'.join(words)})\b", re.IGNORECASE)
+
+
+# Write clauses; a keyword followed by ":" is a map key ({ .name, set: 1 }), not a clause
+_WRITE = re.compile(rf"{_keyword(*WRITE_CLAUSES).pattern}(?!\s*:)", re.IGNORECASE)
+_ADMIN = re.compile(rf"^\s*(?:{'|'.join(ADMIN_COMMANDS)})\b", re.IGNORECASE)
+_CALL_PROCEDURE = re.compile(r"(?<![\w.$:])CALL\s+([\w.]+)", re.IGNORECASE)
+_RETURN = _keyword("RETURN")
+_UNION = _keyword(r"UNION(?:\s+ALL)?")
+_LIMIT_KEYWORD = _keyword("LIMIT")
+# Final LIMIT of a query (or UNION branch): a literal or parameter with nothing after it
+_LIMIT = re.compile(r"(?<![\w.$:])LIMIT\s+(\$\w+|\d+)\s*\Z", re.IGNORECASE)
+_MATCH = _keyword(r"(?:OPTIONAL\s+)?MATCH")
+_CLAUSE_END = _keyword("WHERE", "WITH", "RETURN", "MATCH", "OPTIONAL", "UNWIND", "CALL", "ORDER", "SKIP", "LIMIT",
+                       "UNION")
+# Variable-length relationship ([*], [:T*2..], [r*..3]) and quantified path pattern ({1,}, {,5})
+_VAR_LENGTH = re.compile(r"-\s*\[[^\]]*?\*\s*(\d*)\s*(\.\.)?\s*(\d*)[^\]]*\]")
+_QUANTIFIER = re.compile(r"\)\s*\{\s*\d*\s*,\s*(\d*)\s*\}")
+_PATTERN_VARIABLE = re.compile(r"[(\[]\s*(\w+)|(\w+)\s*=\s*(?:\w+\s*)?\(")
+
+
+class CypherRejected(Exception):
+    # Query refused by the guard; reason is the metrics label
+    def __init__(self, reason):
+        super().__init__(f"Query rejected: {reason.replace('_', ' ')}")
+        self.reason = reason
+
+
+def guard_query(cypher, params=None, neo4j_client=None):
+    # Check a query before it runs: read-only, bounded expansions, no Cartesian products and a LIMIT of
+    # at most MAX_QUERY_RESULTS (added or clamped). With CYPHER_EXPLAIN_MAX_ROWS set, the planner's
+    # row estimate must stay under it. Returns the (cypher, params) to run, or raises CypherRejected.
+    analysis = _analyze_cached(cypher)
+    if isinstance(analysis, str):
+        _reject(analysis)
+    guarded, limit_params, rewrite = analysis
+
+    params = dict(params or {})
+    for name in limit_params:
+        limit = _clamp_limit(params.get(name))
+        if limit != params.get(name):
+            params[name] = limit
+            rewrite = rewrite or "limit_clamped"
+    if rewrite:
+        metrics.inc("cypher_guard_rewrites_total", help_text="Queries changed by the Cypher guard", action=rewrite)
+
+    if config.CYPHER_EXPLAIN_MAX_ROWS and hasattr(neo4j_client, "estimate_rows"):
+        rows = _estimated_rows(neo4j_client, guarded, params)
+        if rows is not None and rows > config.CYPHER_EXPLAIN_MAX_ROWS:
+            _reject("estimated_rows")
+
+    return guarded, params
+
+
+def _reject(reason):
+    metrics.inc("cypher_guard_rejections_total", help_text="Queries refused by the Cypher guard", reason=reason)
+    raise CypherRejected(reason)
+
+
+def _analyze_cached(cypher):
+    # Static analysis depends on the query text only, so it runs once per distinct query
+    with _lock:
+        analysis = _analyses.get(cypher)
+        if analysis is not None:
+            _analyses.move_to_end(cypher)
+            return analysis
+
+    analysis = _analyze(cypher)
+
+    with _lock:
+        _analyses[cypher] = analysis
+        if len(_analyses) > config.CYPHER_GUARD_CACHE_SIZE:
+            _analyses.popitem(last=False)
+    return analysis
+
+
+def _analyze(cypher):
+    # (guarded cypher, names of LIMIT parameters, rewrite action or None), or a rejection reason
+    cypher = cypher.strip()
+    masked = _mask(cypher)
+    if masked.endswith(";"):
+        cypher, masked = cypher[:-1].rstrip(), masked[:-1].rstrip()
+    if ";" in masked:
+        return "multiple_statements"
+
+    if _WRITE.search(masked):
+        return "write_clause"
+    if _ADMIN.search(masked):
+        return "admin_command"
+    for match in _CALL_PROCEDURE.finditer(masked):
+        if match.group(1) not in config.CYPHER_ALLOWED_PROCEDURES:
+            return "procedure_call"
+    if not _RETURN.search(masked):
+        return "no_return"
+
+    for match in _VAR_LENGTH.finditer(masked):
+        lower, dots, upper = match.groups()
+        hops = int(upper) if upper else (None if dots or not lower else int(lower))
+        if hops is None:
+            return "unbounded_path"
+        if hops > config.CYPHER_MAX_PATH_HOPS:
+            return "path_too_long"
+    for match in _QUANTIFIER.finditer(masked):
+        if not match.group(1):
+            return "unbounded_path"
+        if int(match.group(1)) > config.CYPHER_MAX_PATH_HOPS:
+            return "path_too_long"
+
+    if config.CYPHER_REJECT_CARTESIAN and _has_cartesian_product(masked):
+        return "cartesian_product"
+
+    return _bound_limits(cypher, masked)
+
+
+def _mask(cypher):
+    # Same-length copy of the query with literals blanked, backquoted names made plain words and
+    # comments removed, so keywords are only found where they are Cypher
+    def blank(match):
+        text = match.group(0)
+        if text[0] in "'\"":
+            return text[0] + " " * (len(text) - 2) + text[-1]
+        if text[0] == "`":
+            return "_" * len(text)
+        return " " * len(text)
+    return _MASKED.sub(blank, cypher)
+
+
+def _bound_limits(cypher, masked):
+    # Clamp literal LIMITs after the final RETURN of each UNION branch, and add one where it is missing
+    limit_params = []
+    rewrite = None
+    edits = []
+    start = 0
+    for end in [match.start() for match in _UNION.finditer(masked)] + [len(masked)]:
+        branch = masked[start:end]
+        returns = [match for match in _RETURN.finditer(branch) if _depth(branch, match.start()) == 0]
+        if not returns:
+            return "no_return"
+        limit = None
+        for match in _LIMIT_KEYWORD.finditer(branch, returns[-1].end()):
+            if _depth(branch, match.start()) == 0:
+                limit = _LIMIT.match(branch, match.start())
+                if limit is None:
+                    return "limit_expression"
+        if limit is None:
+            edits.append((start + len(branch.rstrip()), start + len(branch.rstrip()),
+                          f"\nLIMIT {config.MAX_QUERY_RESULTS}"))
+            rewrite = "limit_added"
+        elif limit.group(1).startswith("$"):
+            limit_params.append(limit.group(1)[1:])
+        elif int(limit.group(1)) > config.MAX_QUERY_RESULTS:
+            edits.append((start + limit.start(1), start + limit.end(1), str(config.MAX_QUERY_RESULTS)))
+            rewrite = rewrite or "limit_clamped"
+        start = end
+
+    for edit_start, edit_end, text in reversed(edits):
+        cypher = cypher[:edit_start] + text + cypher[edit_end:]
+    return cypher, tuple(limit_params), rewrite
+
+
+def _has_cartesian_product(masked):
+    # True if a (OPTIONAL) MATCH clause has patterns that share no variable, with each other or with
+    # the variables bound by earlier MATCH clauses of the same UNION branch
+    unions = [match.start() for match in _UNION.finditer(masked)]
+    bound = set()
+    previous = 0
+    for match in _MATCH.finditer(masked):
+        if any(previous <= union < match.start() for union in unions):
+            bound = set()
+        previous = match.start()
+        end = _CLAUSE_END.search(masked, match.end())
+        patterns = _split_patterns(masked[match.end():end.start() if end else len(masked)])
+
+        # Group the patterns into connected components; all previously bound variables form one
+        components = [set(bound)] if bound else []
+        for variables in [_pattern_variables(pattern) for pattern in patterns]:
+            merged = set(variables)
+            for component in [c for c in components if c & merged]:
+                merged |= component
+                components.remove(component)
+            components.append(merged)
+        if len(components) > 1:
+            return True
+        for component in components:
+            bound |= component
+    return False
+
+
+def _split_patterns(clause):
+    # Comma-separated patterns of a MATCH clause (commas inside (), [] and {} do not split)
+    patterns = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(clause):
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            patterns.append(clause[start:i])
+            start = i + 1
+    patterns.append(clause[start:])
+    return [pattern for pattern in patterns if pattern.strip()]
+
+
+def _pattern_variables(pattern):
+    return {name for match in _PATTERN_VARIABLE.finditer(pattern) for name in match.groups() if name}
+
+
+def _depth(text, position):
+    # Brace nesting at position (> 0 inside subqueries such as CALL { ... })
+    return text.count("{", 0, position) - text.count("}", 0, position)
+
+
+def _clamp_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return config.MAX_QUERY_RESULTS
+    return min(max(limit, 0), config.MAX_QUERY_RESULTS)
+
+
+def _estimated_rows(neo4j_client, cypher, params):
+    # Planner estimate from EXPLAIN, cached per query text and parameters; None if EXPLAIN fails
+    key = (cypher, json.dumps(params, sort_keys=True, default=str))
+    with _lock:
+        if key in _estimates:
+            _estimates.move_to_end(key)
+            return _estimates[key]
+
+    try:
+        rows = neo4j_client.estimate_rows(cypher, params)
+    except Exception:
+        return None
+
+    with _lock:
+        _estimates[key] = rows
+        if len(_estimates) > config.CYPHER_GUARD_CACHE_SIZE:
+            _estimates.popitem(last=False)
+    return rows
+
+
+# Static analyses and row estimates, shared by all sessions
+_analyses = OrderedDict()
+_estimates = OrderedDict()
+_lock = threading.Lock()
@@ -1,10 +1,21 @@
 import json
-import time
 import config
+from conversation_context import build_conversation_context
+from llm_client import complete_with_fallback, AllModelsFailedError
+
+# Expected structure of the analysis JSON returned by the model
+ANALYSIS_SCHEMA = {
+    "entities": list,
+    "aspects": list,
+    "relationships_to_explore": list,
+    "query_strategy": str,
+    "reasoning": str
+}
+QUERY_STRATEGIES = ("single_entity", "multiple_entities", "complex_interaction", "no_graph_needed")
 
 def deep_analysis_of_question(client, question, conversation_history=None, model_option="Auto (tries multiple)"):
 
-    context = _build_conversation_context(conversation_history)
+    context = build_conversation_context(conversation_history, "analysis")
 
     prompt = f"""You are an expert biomedical analyst. Perform a DEEP ANALYSIS of this question before any database queries.
 
@@ -55,50 +66,109 @@ If question is NOT about biomedical entities in the graph, return:
 """
 
     messages = [{'role': 'user', 'content': prompt}]
-    models_to_try = _get_models_list(model_option)
-
-    for model in models_to_try:
-        try:
-            response = client.chat.complete(
-                model=model,
-                messages=messages,
-                temperature=config.ANALYSIS_TEMPERATURE
-            )
-            analysis_text = response.choices[0].message.content.strip()
-
-            # Clean up the response to extract JSON
-            analysis_text = _extract_json(analysis_text)
-
-            # Parse JSON
-            analysis = json.loads(analysis_text)
-            return analysis
-
-        except Exception as e:
-            if model == models_to_try[-1]:
-                # Return default analysis if all models fail
-                return {
-                    "entities": [],
-                    "aspects": [],
-                    "relationships_to_explore": [],
-                    "query_strategy": "no_graph_needed",
-                    "reasoning": "Failed to analyze question"
-                }
-            time.sleep(1)
-            continue
-
-
-def _build_conversation_context(conversation_history):
-    # Build context string from recent conversation history
-    if not conversation_history or len(conversation_history) <= 1:
-        return ""
-
-    recent_messages = conversation_history[-config.RECENT_MESSAGES_FOR_CONTEXT:]
-    context = "Recent conversation context:\n"
-    for msg in recent_messages:
-        content = msg['content'][:200]
-        context += f"{msg['role']}: {content}\n"
-    context += "\n"
-    return context
+
+    try:
+        return complete_with_fallback(
+            client, messages, config.ANALYSIS_TEMPERATURE, "analysis", model_option, parse=_parse_analysis
+        )
+    except AllModelsFailedError:
+        # Return default analysis if all models fail
+        return _default_analysis()
+
+
+def classify_and_analyze(client, question, conversation_history=None, model_option="Auto (tries multiple)"):
+    # Fused mode: classify ("GRAPH"/"DIRECT") and analyze the question in a single LLM call
+    context = build_conversation_context(conversation_history, "analysis")
+
+    prompt = f"""You are an expert biomedical analyst. Classify this question and, if it needs the knowledge graph, perform a DEEP ANALYSIS of it before any database queries.
+
+{context}
+
+User question: "{question}"
+
+Step 1 - Classification:
+- GRAPH: Question explicitly asks about specific scientific entities (gene names like BRCA1/TP53, protein names, drug names like Tamoxifen, specific pathways)
+- DIRECT: Everything else (patient information, general questions about symptoms/risk factors/advice, greetings, thanks, follow-ups, treatment options without named entities)
+
+Step 2 - Analysis (GRAPH questions only):
+1. What are ALL the biomedical entities mentioned? (genes, proteins, drugs, pathways, cell types)
+2. What relationships or interactions is the user asking about?
+3. Are there multiple aspects to this question that require separate queries?
+4. What is the logical connection between entities?
+
+Knowledge graph structure reminder:
+- Nodes: Source and Destination (both have 'name' property)
+- Relations: TO (with 'type' property describing the relationship)
+- Contains: genes, proteins, drugs, pathways, molecular interactions
+
+Respond with ONLY valid JSON in this exact format:
+{{
+  "classification": "GRAPH" or "DIRECT",
+  "entities": ["entity1", "entity2", ...],
+  "aspects": ["aspect1", "aspect2", ...],
+  "relationships_to_explore": ["relationship type 1", "relationship type 2", ...],
+  "query_strategy": "single_entity" or "multiple_entities" or "complex_interaction",
+  "reasoning": "Brief explanation of your analysis"
+}}
+
+For DIRECT questions, return empty lists and "query_strategy": "no_graph_needed".
+"""
+
+    messages = [{'role': 'user', 'content': prompt}]
+
+    try:
+        return complete_with_fallback(
+            client, messages, config.ANALYSIS_TEMPERATURE, "analysis", model_option, parse=_parse_fused_analysis
+        )
+    except AllModelsFailedError:
+        return "DIRECT", _default_analysis()  # Default to direct answer if all models fail
+
+
+def _parse_analysis(analysis_text):
+    # Extract, parse and validate the analysis JSON (raises on unusable output)
+    analysis = json.loads(_extract_json(analysis_text.strip()))
+    _validate_analysis(analysis)
+    return analysis
+
+
+def _parse_fused_analysis(analysis_text):
+    # Parse fused-mode output into (query_type, analysis)
+    analysis = json.loads(_extract_json(analysis_text.strip()))
+    if not isinstance(analysis, dict):
+        raise ValueError("Analysis must be a JSON object")
+
+    classification = str(analysis.pop("classification", "")).strip().upper()
+    _validate_analysis(analysis)
+
+    if classification != "GRAPH" or analysis["query_strategy"] == "no_graph_needed":
+        return "DIRECT", analysis
+    return "GRAPH", analysis
+
+
+def _validate_analysis(analysis):
+    # Raise ValueError if the analysis does not match ANALYSIS_SCHEMA
+    if not isinstance(analysis, dict):
+        raise ValueError("Analysis must be a JSON object")
+
+    for field, field_type in ANALYSIS_SCHEMA.items():
+        if not isinstance(analysis.get(field), field_type):
+            raise ValueError(f"Analysis field '{field}' must be of type {field_type.__name__}")
+        if field_type is list and not all(isinstance(item, str) for item in analysis[field]):
+            raise ValueError(f"Analysis field '{field}' must be a list of strings")
+
+    if analysis["query_strategy"] not in QUERY_STRATEGIES:
+        raise ValueError(f"Unknown query strategy: {analysis['query_strategy']}")
+
+
+def _default_analysis():
+    # Analysis returned when no model produced a usable answer
+    return {
+        "entities": [],
+        "aspects": [],
+        "relationships_to_explore": [],
+        "query_strategy": "no_graph_needed",
+        "reasoning": "Failed to analyze question"
+    }
 
 
 def _extract_json(text):
@@ -108,11 +178,3 @@ def _extract_json(text):
     elif "```" in text:
         return text.split("```")[1].split("```")[0].strip()
     return text
-
-
-def _get_models_list(model_option):
-    # Return list of models to try based on selected option
-    if model_option == "Auto (tries multiple)":
-        return config.DEFAULT_MODELS
-    else:
-        return [model_option]
\ No newline at end of file
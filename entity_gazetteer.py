@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import deque
+import config
+from neo4j_client import get_neo4j_client
+
+
+class EntityGazetteer:
+    # Aho-Corasick automaton over all graph entity names (case-folded) plus configured aliases
+
+    def __init__(self, aliases=None, min_length=None):
+        self.min_length = min_length or config.GAZETTEER_MIN_NAME_LENGTH
+        self._names = {}      # folded name -> name as stored in the graph
+        self._aliases = {}    # folded alias -> canonical graph name
+        self._goto = [{}]     # trie transitions per state
+        self._fail = [0]      # failure link per state
+        self._terminal = [None]  # folded pattern ending exactly at each state
+        self._output = [[]]   # patterns matched at each state (own plus via failure links)
+        self._dirty = False   # failure links need rebuilding
+        self._joined = ""     # all folded names, for substring checks
+        self._lock = threading.RLock()
+
+        for alias, canonical in (aliases or {}).items():
+            self.add_alias(alias, canonical)
+
+    def add_names(self, names):
+        # Insert new graph names; returns how many were not known before
+        added = 0
+        with self._lock:
+            for name in names:
+                if not isinstance(name, str):
+                    continue
+                folded = name.strip().casefold()
+                if len(folded) < self.min_length or folded in self._names:
+                    continue
+                self._names[folded] = name.strip()
+                self._insert(folded)
+                added += 1
+            if added:
+                self._dirty = True
+        return added
+
+    def add_alias(self, alias, canonical):
+        # Register a synonym that resolves to a canonical graph name
+        folded = alias.strip().casefold()
+        if len(folded) < self.min_length:
+            return
+        with self._lock:
+            self._aliases[folded] = canonical
+            self._insert(folded)
+            self._dirty = True
+
+    def find_entities(self, text):
+        # Graph entities mentioned in text, in order of appearance (leftmost-longest, whole words only)
+        with self._lock:
+            self._build()
+            folded_text = text.casefold()
+            matches = []
+            state = 0
+
+            for i, char in enumerate(folded_text):
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                state = self._goto[state].get(char, 0)
+
+                for pattern in self._output[state]:
+                    start = i - len(pattern) + 1
+                    if _is_word_boundary(folded_text, start, i + 1):
+                        matches.append((start, i + 1, pattern))
+
+            entities = []
+            covered_until = -1
+            for start, end, pattern in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+                if start < covered_until:
+                    continue
+                name = self._resolve(pattern)
+                if name is None:
+                    continue
+                covered_until = end
+                if name not in entities:
+                    entities.append(name)
+
+            return entities
+
+    def filter_known(self, entities):
+        # Keep entities that match at least one graph name (same CONTAINS semantics as the query templates).
+        # Aliases are replaced by the graph name they stand for, so queries search for that name.
+        with self._lock:
+            if not self._names:
+                return list(entities)
+            self._build()
+            known = []
+            seen = set()
+            for entity in entities:
+                if not isinstance(entity, str) or not entity.strip():
+                    continue
+                folded = entity.strip().casefold()
+                name = self._resolve(folded) if folded in self._aliases else None
+                if name is None and folded in self._joined:
+                    name = entity
+                if name is not None and name.casefold() not in seen:
+                    seen.add(name.casefold())
+                    known.append(name)
+            return known
+
+    def __contains__(self, name):
+        return name.strip().casefold() in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def _resolve(self, pattern):
+        # Graph name for a matched pattern; aliases only resolve when their target exists in the graph
+        if pattern in self._names:
+            return self._names[pattern]
+        canonical = self._aliases.get(pattern)
+        if canonical is not None and canonical.casefold() in self._names:
+            return self._names[canonical.casefold()]
+        return None
+
+    def _insert(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._output.append([])
+            state = next_state
+        self._terminal[state] = pattern
+
+    def _build(self):
+        # Recompute failure links (breadth-first) after insertions
+        if not self._dirty:
+            return
+
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            self._output[next_state] = _own_output(self._terminal[next_state])
+            queue.append(next_state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = (
+                    _own_output(self._terminal[next_state]) + self._output[self._fail[next_state]]
+                )
+
+        self._joined = "\n".join(self._names)
+        self._dirty = False
+
+
+def _own_output(pattern):
+    # Output list for a state's own terminal pattern
+    return [pattern] if pattern is not None else []
+
+
+def _is_word_boundary(text, start, end):
+    # True if text[start:end] is not embedded in a longer alphanumeric token
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+# Global gazetteer instance
+_gazetteer = None
+_gazetteer_failed_at = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    # Gazetteer built once from every Source/Destination name in the graph (normally during warm-up).
+    # After a failed build, callers get an error without a new scan for GAZETTEER_RETRY_SECONDS.
+    global _gazetteer, _gazetteer_failed_at
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            if _gazetteer_failed_at is not None and \
+                    time.monotonic() - _gazetteer_failed_at < config.GAZETTEER_RETRY_SECONDS:
+                raise Exception("Entity gazetteer unavailable: the last build failed")
+            try:
+                gazetteer = EntityGazetteer(aliases=config.ENTITY_ALIASES)
+                gazetteer.add_names(get_neo4j_client().fetch_entity_names())
+            except Exception:
+                _gazetteer_failed_at = time.monotonic()
+                raise
+            _gazetteer = gazetteer
+            _gazetteer_failed_at = None
+    return _gazetteer
+
+
+def refresh_gazetteer():
+    # Add names that appeared in the graph since the gazetteer was built; returns the number added
+    return get_gazetteer().add_names(get_neo4j_client().fetch_entity_names())
+
+
+def build_gazetteer_analysis(entities):
+    # Analysis equivalent to deep_analysis output for entities matched locally
+    return {
+        "entities": entities,
+        "aspects": [f"Relationships of {entity}" for entity in entities],
+        "relationships_to_explore": [],
+        "query_strategy": "single_entity" if len(entities) == 1 else "multiple_entities",
+        "reasoning": "Entities matched directly against knowledge graph names"
+    }
@@ -0,0 +1,377 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+import numpy as np
+import config
+from cypher_compiler import SINGLE_ENTITY_TEMPLATE, TWO_ENTITY_TEMPLATE, RELATIONSHIP_TEMPLATE
+from instrumentation import record_query
+from triplet import Triplet
+
+FORMAT_VERSION = 1
+
+# Arrays of a snapshot directory, each stored as <name>.npy
+ARRAYS = ("name_offsets", "lower_offsets", "fwd_indptr", "fwd_dst", "fwd_rel", "rev_indptr", "rev_src", "rev_rel")
+
+
+def _template_shape(cypher_query):
+    # Whitespace-insensitive form of a template, also accepting the name_lower index rewrite
+    return " ".join(re.sub(r"toLower\(\s*(\w+)\.name\s*\)", r"\1.name_lower", cypher_query).split())
+
+
+_TEMPLATES = {
+    _template_shape(SINGLE_ENTITY_TEMPLATE): "single",
+    _template_shape(TWO_ENTITY_TEMPLATE): "pair",
+    _template_shape(RELATIONSHIP_TEMPLATE): "relationship"
+}
+
+
+class SnapshotClient:
+    # In-process stand-in for Neo4jClient over a compressed-sparse-row snapshot of the
+    # (Source)-[TO {type}]->(Destination) graph. Nodes are identified by name (sorted), relation
+    # types are interned, and forward/reverse adjacency arrays are memory-mapped, so worker
+    # processes share one copy of the graph through the page cache.
+    # Answers the three templates of cypher_compiler; other queries go to the fallback client.
+
+    def __init__(self, path=None, fallback=None, match_cache_size=None):
+        self.path = path or config.GRAPH_SNAPSHOT_PATH
+        self.fallback = fallback  # callable returning a Neo4jClient, used for unsupported queries
+        self.cache = None
+        self._fallback_client = None
+        self._match_cache = OrderedDict()
+        self._match_cache_size = match_cache_size or config.GRAPH_SNAPSHOT_MATCH_CACHE_SIZE
+        self._query_shapes = Counter()
+        self._lock = threading.Lock()
+        self._files = []
+
+    def connect(self):
+        # Map the snapshot files
+        with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise Exception(f"Unsupported graph snapshot version: {meta.get('version')}")
+
+        self.meta = meta
+        self.relations = meta["relations"]
+        self.relations_lower = [relation.lower() for relation in self.relations]
+        self.node_count = meta["nodes"]
+
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r"))
+        self.names = self._map("names.bin")
+        self.names_lower = self._map("names_lower.bin")
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        self._files = []
+        if self._fallback_client is not None:
+            self._fallback_client.close()
+
+    def test_connection(self):
+        return self.node_count >= 0
+
+    def execute_query(self, cypher_query, parameters=None):
+        # Evaluate a template query against the snapshot, returning Triplets like Neo4jClient
+        kind = _TEMPLATES.get(_template_shape(cypher_query))
+        if kind is None:
+            if self.fallback is None:
+                raise Exception("Unsupported query for graph snapshot")
+            return self._get_fallback().execute_query(cypher_query, parameters)
+
+        started = time.perf_counter()
+        with self._lock:
+            self._query_shapes[kind] += 1
+
+        params = parameters or {}
+        limit = int(params.get("limit", config.MAX_QUERY_RESULTS))
+        try:
+            if kind == "single":
+                edges = self._single_entity(str(params["entity"]).lower(), limit)
+            elif kind == "pair":
+                edges = self._entity_pair(str(params["entity1"]).lower(), str(params["entity2"]).lower(), limit)
+            else:
+                edges = self._relationship(str(params["entity"]).lower(), str(params["relationship"]).lower(), limit)
+        except KeyError as e:
+            record_query(0, time.perf_counter() - started, error=e)
+            raise Exception(f"Missing query parameter: {e}")
+
+        triplets = [Triplet(self.name(src), self.relations[rel], self.name(dst)) for src, rel, dst in edges]
+        record_query(len(triplets), time.perf_counter() - started)
+        return triplets
+
+    def name(self, node):
+        # Original name of a node id
+        return self.names[int(self.name_offsets[node]):int(self.name_offsets[node + 1]) - 1].decode("utf-8")
+
+    def node_id(self, name):
+        # Id of the node with exactly this name (binary search over the sorted names), or None
+        low, high = 0, self.node_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.node_count and self.name(low) == name else None
+
+    def find_nodes(self, term, limit):
+        # Names of nodes whose lowercase name contains term, exact matches and shorter names first
+        names = [self.name(node) for node in self.match(term).tolist()]
+        names.sort(key=lambda name: (name.lower() != term, len(name)))
+        return names[:limit]
+
+    def expand_frontier(self, names, relations, fanout):
+        # Outgoing then incoming edges of the named nodes, at most fanout per node, optionally only
+        # relation types containing one of the relations terms
+        started = time.perf_counter()
+        relation_ids = None
+        if relations:
+            relation_ids = {i for i, relation in enumerate(self.relations_lower)
+                            if any(term in relation for term in relations)}
+
+        triplets = []
+        for name in names:
+            node = self.node_id(name)
+            if node is None:
+                continue
+            count = 0
+            for indptr, others, rels, outgoing in ((self.fwd_indptr, self.fwd_dst, self.fwd_rel, True),
+                                                   (self.rev_indptr, self.rev_src, self.rev_rel, False)):
+                start, end = int(indptr[node]), int(indptr[node + 1])
+                for other, rel in zip(others[start:end].tolist(), rels[start:end].tolist()):
+                    if count >= fanout:
+                        break
+                    if relation_ids is not None and rel not in relation_ids:
+                        continue
+                    other_name = self.name(other)
+                    relation = self.relations[rel]
+                    triplets.append(Triplet(name, relation, other_name) if outgoing
+                                    else Triplet(other_name, relation, name))
+                    count += 1
+        record_query(len(triplets), time.perf_counter() - started)
+        return triplets
+
+    def fetch_entity_names(self):
+        return [self.name(node) for node in range(self.node_count)]
+
+    def invalidate_cache(self):
+        with self._lock:
+            self._match_cache.clear()
+
+    def cache_stats(self):
+        return None
+
+    def query_shape_stats(self, top=10):
+        with self._lock:
+            return {
+                "distinct_shapes": len(self._query_shapes),
+                "executions": sum(self._query_shapes.values()),
+                "most_common": self._query_shapes.most_common(top)
+            }
+
+    def match(self, term):
+        # Sorted ids of nodes whose lowercase name contains term (memoized per term)
+        with self._lock:
+            ids = self._match_cache.get(term)
+            if ids is not None:
+                self._match_cache.move_to_end(term)
+                return ids
+
+        ids = self._scan(term)
+
+        with self._lock:
+            self._match_cache[term] = ids
+            if len(self._match_cache) > self._match_cache_size:
+                self._match_cache.popitem(last=False)
+        return ids
+
+    def _scan(self, term):
+        # Substring search directly on the mapped lowercase name table (one name per line)
+        if not term:
+            return np.arange(self.node_count)
+        needle = term.encode("utf-8")
+        if b"\n" in needle:
+            return np.empty(0, dtype=np.int64)
+
+        ids = []
+        position = self.names_lower.find(needle)
+        while position != -1:
+            node = int(np.searchsorted(self.lower_offsets, position, side="right")) - 1
+            ids.append(node)
+            position = self.names_lower.find(needle, int(self.lower_offsets[node + 1]))
+        return np.array(ids, dtype=np.int64)
+
+    def _single_entity(self, term, limit):
+        # Edges with a matching source or destination
+        matched = self.match(term)
+        matched_set = set(matched.tolist())
+        edges = []
+        for node in matched.tolist():
+            start, end = int(self.fwd_indptr[node]), int(self.fwd_indptr[node + 1])
+            for dst, rel in zip(self.fwd_dst[start:end].tolist(), self.fwd_rel[start:end].tolist()):
+                edges.append((node, rel, dst))
+                if len(edges) >= limit:
+                    return edges
+
+            start, end = int(self.rev_indptr[node]), int(self.rev_indptr[node + 1])
+            for src, rel in zip(self.rev_src[start:end].tolist(), self.rev_rel[start:end].tolist()):
+                if src in matched_set:
+                    continue  # already returned as an outgoing edge of src
+                edges.append((src, rel, node))
+                if len(edges) >= limit:
+                    return edges
+        return edges
+
+    def _entity_pair(self, first, second, limit):
+        # Edges between a node matching one term and a node matching the other, in either direction
+        first_ids = self.match(first)
+        second_ids = self.match(second)
+        edges = []
+        seen = set()
+        for sources, targets in ((first_ids, second_ids), (second_ids, first_ids)):
+            target_set = set(targets.tolist())
+            for node in sources.tolist():
+                start, end = int(self.fwd_indptr[node]), int(self.fwd_indptr[node + 1])
+                for offset, dst in enumerate(self.fwd_dst[start:end].tolist()):
+                    if dst in target_set and start + offset not in seen:
+                        seen.add(start + offset)
+                        edges.append((node, int(self.fwd_rel[start + offset]), dst))
+                        if len(edges) >= limit:
+                            return edges
+        return edges
+
+    def _relationship(self, term, relationship, limit):
+        # Outgoing edges of matching nodes whose relation type contains relationship
+        relation_ids = {i for i, relation in enumerate(self.relations_lower) if relationship in relation}
+        if not relation_ids:
+            return []
+        edges = []
+        for node in self.match(term).tolist():
+            start, end = int(self.fwd_indptr[node]), int(self.fwd_indptr[node + 1])
+            for dst, rel in zip(self.fwd_dst[start:end].tolist(), self.fwd_rel[start:end].tolist()):
+                if rel in relation_ids:
+                    edges.append((node, rel, dst))
+                    if len(edges) >= limit:
+                        return edges
+        return edges
+
+    def _map(self, filename):
+        # Read-only memory map of a snapshot file
+        f = open(os.path.join(self.path, filename), "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _get_fallback(self):
+        with self._lock:
+            if self._fallback_client is None:
+                self._fallback_client = self.fallback()
+        return self._fallback_client
+
+
+def export_snapshot(triplets, path):
+    # Write (source, relation, destination) triplets as a CSR snapshot directory; returns (nodes, edges)
+    names = {}
+    relations = {}
+    sources = []
+    destinations = []
+    relation_ids = []
+    for source, relation, destination in triplets:
+        if not source or not destination:
+            continue
+        source = source.replace("\n", " ")
+        destination = destination.replace("\n", " ")
+        sources.append(names.setdefault(source, len(names)))
+        destinations.append(names.setdefault(destination, len(names)))
+        relation_ids.append(relations.setdefault(relation or "RELATED", len(relations)))
+
+    # Renumber nodes in name order
+    sorted_names = sorted(names)
+    renumber = np.empty(len(names), dtype=np.int32)
+    for new_id, name in enumerate(sorted_names):
+        renumber[names[name]] = new_id
+    src = renumber[np.array(sources, dtype=np.int64)] if sources else np.empty(0, dtype=np.int32)
+    dst = renumber[np.array(destinations, dtype=np.int64)] if destinations else np.empty(0, dtype=np.int32)
+    rel = np.array(relation_ids, dtype=np.int32)
+
+    arrays = {}
+    forward = np.lexsort((dst, src))
+    arrays["fwd_indptr"] = _indptr(src, len(names))
+    arrays["fwd_dst"] = dst[forward]
+    arrays["fwd_rel"] = rel[forward]
+    reverse = np.lexsort((src, dst))
+    arrays["rev_indptr"] = _indptr(dst, len(names))
+    arrays["rev_src"] = src[reverse]
+    arrays["rev_rel"] = rel[reverse]
+
+    encoded = [(name + "\n").encode("utf-8") for name in sorted_names]
+    encoded_lower = [(name.lower() + "\n").encode("utf-8") for name in sorted_names]
+    arrays["name_offsets"] = _offsets(encoded)
+    arrays["lower_offsets"] = _offsets(encoded_lower)
+
+    # Write to a temporary directory and swap it in, so readers never see a partial snapshot
+    temp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    for name in ARRAYS:
+        np.save(os.path.join(temp_path, f"{name}.npy"), arrays[name])
+    with open(os.path.join(temp_path, "names.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(temp_path, "names_lower.bin"), "wb") as f:
+        f.write(b"".join(encoded_lower))
+    with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "created_at": time.time(),
+            "nodes": len(names),
+            "edges": int(len(rel)),
+            "relations": list(relations)
+        }, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+    return len(names), int(len(rel))
+
+
+def _indptr(node_ids, node_count):
+    # Row pointers: edges of node i are at [indptr[i], indptr[i + 1])
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(node_ids, minlength=node_count), out=indptr[1:])
+    return indptr
+
+
+def _offsets(encoded):
+    # Byte offset of each encoded name, plus the total length
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets
+
+
+def main():
+    # Export the Neo4j graph to a snapshot directory
+    from neo4j_client import Neo4jClient
+
+    parser = argparse.ArgumentParser(description="Export the knowledge graph to a memory-mapped CSR snapshot")
+    parser.add_argument("--path", default=config.GRAPH_SNAPSHOT_PATH or "graph_snapshot",
+                        help="Snapshot directory (replaced atomically)")
+    args = parser.parse_args()
+
+    client = Neo4jClient()
+    client.connect()
+    try:
+        nodes, edges = export_snapshot(client.iter_triplets(), args.path)
+    finally:
+        client.close()
+    print(f"Exported {nodes} nodes and {edges} edges to {args.path}")
+    print("Set GRAPH_SNAPSHOT_PATH to serve queries from the snapshot.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 1, 5, 10, 15, 25, 50, 100, 500)
+
+# Trace of the request being processed in the current context
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class MetricsRegistry:
+    # Process-wide counters, gauges and histograms with labels, exportable in Prometheus text format
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {labels: value}
+        self._gauges = {}      # name -> {labels: value}
+        self._histograms = {}  # name -> (buckets, {labels: [bucket counts..., sum, count]})
+        self._help = {}
+
+    def inc(self, name, amount=1, help_text=None, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+            if help_text:
+                self._help[name] = help_text
+
+    def set_gauge(self, name, value, help_text=None, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+            if help_text:
+                self._help[name] = help_text
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help_text=None, **labels):
+        with self._lock:
+            bucket_bounds, series = self._histograms.setdefault(name, (buckets, {}))
+            key = _label_key(labels)
+            counts = series.setdefault(key, [0] * len(bucket_bounds) + [0.0, 0])
+            for i, bound in enumerate(bucket_bounds):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+            if help_text:
+                self._help[name] = help_text
+
+    def snapshot(self):
+        # Plain-dict copy of all series (used by benchmarks and tests)
+        with self._lock:
+            return {
+                "counters": {name: dict(series) for name, series in self._counters.items()},
+                "gauges": {name: dict(series) for name, series in self._gauges.items()},
+                "histograms": {
+                    name: {key: {"sum": counts[-2], "count": counts[-1]} for key, counts in series.items()}
+                    for name, (_, series) in self._histograms.items()
+                }
+            }
+
+    def render_prometheus(self):
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, (buckets, series) in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, counts in sorted(series.items()):
+                    for bound, count in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_number(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {counts[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {counts[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+class Trace:
+    # Spans recorded while processing one request
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started = time.time()
+        self.duration_ms = None
+        self.spans = []
+        self.keep_open = False  # set by a request that returns a stream; see trace_stream
+        self._lock = threading.Lock()
+
+    def add_span(self, name, kind, started, duration, attributes=None):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "kind": kind,
+                "start_offset_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                "attributes": attributes or {}
+            })
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "timestamp": self.started,
+                "duration_ms": self.duration_ms,
+                "attributes": self.attributes,
+                "spans": list(self.spans)
+            }
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
+
+# Serializes writes to the trace log file
+_trace_log_lock = threading.Lock()
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    # Record a request-level trace; spans created inside (also in bound worker threads) attach to it
+    # With trace.keep_open set on a normal exit, trace_stream finishes the trace instead.
+    trace = Trace(name, attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.keep_open = False
+        raise
+    finally:
+        _current_trace.reset(token)
+        if not trace.keep_open:
+            _finish_trace(trace)
+
+
+@contextmanager
+def span(name, kind="phase", **attributes):
+    # Time a block as a span of the current trace and as a phase duration histogram observation
+    started = time.time()
+    perf_started = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        _record_span(_current_trace.get(), name, kind, started, time.perf_counter() - perf_started, attributes)
+
+
+def trace_stream(trace, iterator, span_name, kind="phase"):
+    # Read a stream returned from inside start_trace (with trace.keep_open): spans recorded while it is
+    # read (e.g. the streamed LLM call) attach to trace, span_name times the whole read, and the trace is
+    # exported once the stream is used up or closed
+    started = time.time()
+    perf_started = time.perf_counter()
+    iterator = iter(iterator)
+    try:
+        while True:
+            token = _current_trace.set(trace)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_trace.reset(token)
+            yield item
+    finally:
+        token = _current_trace.set(trace)
+        try:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            _current_trace.reset(token)
+            _record_span(trace, span_name, kind, started, time.perf_counter() - perf_started, {})
+            _finish_trace(trace)
+
+
+def _record_span(trace, name, kind, started, duration, attributes):
+    if trace is not None:
+        trace.add_span(name, kind, started, duration, attributes)
+    if kind == "phase":
+        metrics.observe("pipeline_phase_duration_seconds", duration, phase=name,
+                        help_text="Duration of pipeline phases")
+
+
+def _finish_trace(trace):
+    trace.duration_ms = round((time.time() - trace.started) * 1000, 3)
+    _export_trace(trace)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def bind_context(func):
+    # Wrap func to run in a copy of the caller's context (propagates the trace into worker threads)
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def record_llm_attempt(stage, model, latency, success, error=None, usage=None, cache_hit=False, streamed=False):
+    # One call to the Mistral API (or a cache hit standing in for it)
+    attributes = {"stage": stage, "model": model, "success": success, "cache_hit": cache_hit}
+    if streamed:
+        attributes["streamed"] = True
+    if error is not None:
+        attributes["error"] = str(error)[:200]
+
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        attributes["prompt_tokens"] = prompt_tokens
+        attributes["completion_tokens"] = completion_tokens
+        metrics.inc("llm_tokens_total", prompt_tokens, help_text="Tokens used by LLM calls",
+                    stage=stage, model=model, kind="prompt")
+        metrics.inc("llm_tokens_total", completion_tokens, stage=stage, model=model, kind="completion")
+
+    outcome = "cache_hit" if cache_hit else ("success" if success else "error")
+    metrics.inc("llm_requests_total", help_text="LLM call attempts by outcome", stage=stage, model=model, outcome=outcome)
+    if not cache_hit:
+        metrics.observe("llm_request_duration_seconds", latency, help_text="LLM call latency",
+                        stage=stage, model=model)
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(f"llm.{stage}", "llm", time.time() - latency, latency, attributes)
+
+    if not success:
+        logger.warning("LLM call failed (stage=%s, model=%s): %s", stage, model, error)
+
+
+def record_query(rows, latency, cache_hit=False, error=None):
+    # One Cypher query execution (or result cache hit)
+    outcome = "error" if error is not None else "ok"
+    metrics.inc("cypher_queries_total", help_text="Cypher queries by outcome and cache use",
+                outcome=outcome, cache="hit" if cache_hit else "miss")
+    if error is None:
+        metrics.observe("cypher_query_duration_seconds", latency, help_text="Cypher query latency",
+                        cache="hit" if cache_hit else "miss")
+        metrics.observe("cypher_query_rows", rows, buckets=ROW_BUCKETS, help_text="Triplets returned per query")
+
+    trace = _current_trace.get()
+    if trace is not None:
+        attributes = {"rows": rows, "cache_hit": cache_hit}
+        if error is not None:
+            attributes["error"] = str(error)[:200]
+        trace.add_span("cypher", "query", time.time() - latency, latency, attributes)
+
+    if error is not None:
+        logger.warning("Cypher query failed: %s", error)
+
+
+def _export_trace(trace):
+    # Write the finished trace as one JSON line to TRACE_LOG_PATH, or to the debug log
+    line = json.dumps(trace.to_dict(), default=str)
+    if config.TRACE_LOG_PATH:
+        with _trace_log_lock, open(config.TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    else:
+        logger.debug("trace %s", line)
+
+
+def _label_key(labels):
+    # Hashable, ordered representation of a label set
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key):
+    # {name="value",...} with Prometheus escaping
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_number(value):
+    return f"{value:g}"
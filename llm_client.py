@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import time
+import config
+import cancellation
+from cache import TieredCache
+from model_router import router, models_for_option
+from rate_limiter import rate_limiter, inflight_calls, estimate_tokens, usage_tokens
+from instrumentation import record_llm_attempt, metrics
+
+logger = logging.getLogger(__name__)
+
+# Shared response cache (created lazily from config)
+_llm_cache = None
+
+
+class AllModelsFailedError(Exception):
+    # Raised when no model produced a usable response for a stage
+    def __init__(self, stage, last_error=None):
+        super().__init__(f"All models failed for stage '{stage}': {last_error}")
+        self.stage = stage
+        self.last_error = last_error
+
+
+def complete_with_fallback(client, messages, temperature, stage, model_option, parse=None):
+    # Try models in router order (healthiest/fastest first) with jittered exponential backoff between
+    # attempts. parse(content) may raise to reject unusable output and move on to the next model.
+    last_error = None
+    models_to_try = router.order(models_for_option(model_option))
+    if not models_to_try:
+        raise AllModelsFailedError(stage, "circuit open for every model")
+
+    for attempt, model in enumerate(models_to_try):
+        delay = router.backoff_delay(attempt, model)
+        if delay:
+            cancellation.sleep(delay)
+
+        try:
+            content = chat_complete(client, model, messages, temperature, stage=stage)
+        except Exception as e:
+            # Our own cancellation ends the request; anything else (including the cancellation of a
+            # call this one was coalesced with) moves on to the next model
+            cancellation.check_cancelled()
+            last_error = e
+            continue
+
+        if parse is None:
+            return content
+        try:
+            return parse(content)
+        except Exception as e:
+            logger.warning("Unusable %s output from %s: %s", stage, model, e)
+            # chat_complete cached the raw response; do not replay it to the next request
+            _forget_response(stage, model, temperature, messages)
+            last_error = e
+
+    raise AllModelsFailedError(stage, last_error)
+
+
+def chat_complete(client, model, messages, temperature, stage):
+    # Send chat completion request and return the message content, memoized per stage.
+    # Identical requests already in flight (e.g. two users asking the same question) share one call.
+    cache = get_llm_cache() if is_cache_enabled(stage) else None
+    key = llm_cache_key(model, temperature, messages)
+
+    if cache is not None:
+        found, content = cache.get(key)
+        if found:
+            record_llm_attempt(stage, model, 0.0, True, cache_hit=True)
+            return content
+
+    if not config.LLM_COALESCE_REQUESTS:
+        content = _complete_once(client, model, messages, temperature, stage)
+    else:
+        content, shared = inflight_calls.run(
+            key, lambda: _complete_once(client, model, messages, temperature, stage)
+        )
+        if shared:
+            metrics.inc("llm_coalesced_requests_total", help_text="LLM calls served by an identical in-flight call",
+                        stage=stage, model=model)
+            return content
+
+    if cache is not None:
+        cache.set(key, content)
+
+    return content
+
+
+def _forget_response(stage, model, temperature, messages):
+    cache = get_llm_cache() if is_cache_enabled(stage) else None
+    if cache is not None:
+        cache.invalidate(llm_cache_key(model, temperature, messages))
+
+
+def _complete_once(client, model, messages, temperature, stage):
+    # One upstream completion call within the model's rate limit budget
+    estimated_tokens = _acquire_rate_limit(model, messages)
+
+    router.before_attempt(model)
+    started = time.perf_counter()
+    try:
+        response = client.chat.complete(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout_ms=_timeout_ms()
+        )
+        content = response.choices[0].message.content
+    except Exception as e:
+        if not cancellation.is_cancelled():
+            router.record_failure(model, e)
+        record_llm_attempt(stage, model, time.perf_counter() - started, False, error=e)
+        raise
+    latency = time.perf_counter() - started
+    usage = getattr(response, "usage", None)
+    router.record_success(model, latency)
+    record_llm_attempt(stage, model, latency, True, usage=usage)
+    _reconcile_rate_limit(model, estimated_tokens, usage)
+
+    return content
+
+
+def stream_complete(client, model, messages, temperature, stage):
+    # Stream chat completion, yielding content chunks; a cached response is replayed as one chunk
+    cache = get_llm_cache() if is_cache_enabled(stage) else None
+
+    if cache is not None:
+        key = llm_cache_key(model, temperature, messages)
+        found, content = cache.get(key)
+        if found:
+            record_llm_attempt(stage, model, 0.0, True, cache_hit=True, streamed=True)
+            yield content
+            return
+
+    chunks = []
+    usage = None
+    estimated_tokens = _acquire_rate_limit(model, messages)
+    router.before_attempt(model)
+    started = time.perf_counter()
+    stream = None
+    try:
+        stream = client.chat.stream(model=model, messages=messages, temperature=temperature, timeout_ms=_timeout_ms())
+        for event in stream:
+            cancellation.check_cancelled()
+            usage = getattr(event.data, "usage", None) or usage
+            content = event.data.choices[0].delta.content
+            if isinstance(content, str) and content:
+                chunks.append(content)
+                yield content
+    except Exception as e:
+        if not cancellation.is_cancelled():
+            router.record_failure(model, e)
+        record_llm_attempt(stage, model, time.perf_counter() - started, False, error=e, streamed=True)
+        raise
+    finally:
+        # Also when the consumer stops reading: release the HTTP response right away
+        if stream is not None:
+            _close_stream(stream)
+    latency = time.perf_counter() - started
+    router.record_success(model, latency)
+    record_llm_attempt(stage, model, latency, True, usage=usage, streamed=True)
+    _reconcile_rate_limit(model, estimated_tokens, usage)
+
+    if cache is not None:
+        cache.set(key, "".join(chunks))
+
+
+def _timeout_ms():
+    # Per-call deadline: LLM_REQUEST_TIMEOUT, or less if the request has less time left
+    return int(cancellation.time_left(config.LLM_REQUEST_TIMEOUT) * 1000)
+
+
+def _close_stream(stream):
+    # SDK event streams are context managers, other iterables (e.g. the benchmark stub) generators
+    if hasattr(stream, "__exit__"):
+        stream.__exit__(None, None, None)
+    elif hasattr(stream, "close"):
+        stream.close()
+
+
+def _acquire_rate_limit(model, messages):
+    # Queue for the model's request/token budget; returns the token estimate charged (0 if disabled)
+    if not config.LLM_RATE_LIMIT_ENABLED:
+        return 0
+    estimated_tokens = estimate_tokens(messages)
+    rate_limiter.acquire(model, estimated_tokens)
+    return estimated_tokens
+
+
+def _reconcile_rate_limit(model, estimated_tokens, usage):
+    if estimated_tokens:
+        rate_limiter.reconcile(model, estimated_tokens, usage_tokens(usage))
+
+
+def llm_cache_key(model, temperature, messages):
+    # Content address of a request: model, temperature and a hash of the prompt messages
+    prompt_hash = hashlib.sha256(
+        json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"{model}|{temperature}|{prompt_hash}"
+
+
+def is_cache_enabled(stage):
+    # True if responses of the given pipeline stage may be served from cache
+    return config.LLM_CACHE_ENABLED and config.LLM_CACHE_STAGES.get(stage, False)
+
+
+def get_llm_cache():
+    # Shared cache instance built from the configured backend
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = _build_llm_cache()
+    return _llm_cache
+
+
+def set_llm_cache(cache):
+    # Plug in a custom cache (any object with get/set/invalidate like TieredCache), or None to reset
+    global _llm_cache
+    _llm_cache = cache
+
+
+def invalidate_llm_cache():
+    # Drop all memoized responses
+    if _llm_cache is not None:
+        _llm_cache.invalidate()
+
+
+def _build_llm_cache():
+    # "memory" keeps responses in-process only; "disk" adds a SQLite tier that survives restarts
+    if config.LLM_CACHE_BACKEND not in ("memory", "disk"):
+        raise ValueError(f"Unknown LLM cache backend: {config.LLM_CACHE_BACKEND}")
+
+    return TieredCache(
+        max_entries=config.LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+        db_path=config.LLM_CACHE_DB_PATH if config.LLM_CACHE_BACKEND == "disk" else None,
+        namespace="llm_responses"
+    )
@@ -0,0 +1,181 @@
+import email.utils
+import random
+import threading
+import time
+import config
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelHealth:
+    # Latency/error statistics and circuit breaker state of one model
+
+    def __init__(self, open_seconds):
+        self.latency = None          # EWMA of successful call latency (seconds)
+        self.error_rate = 0.0        # EWMA of failures (0..1)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.open_seconds = open_seconds
+        self.trial_in_flight = False
+
+
+class ModelRouter:
+    # Orders fallback models by health and speed, with per-model circuit breakers
+
+    def __init__(self, failure_threshold=None, open_seconds=None, max_open_seconds=None, smoothing=None):
+        self.failure_threshold = failure_threshold or config.LLM_CIRCUIT_FAILURE_THRESHOLD
+        self.open_seconds = open_seconds or config.LLM_CIRCUIT_OPEN_SECONDS
+        self.max_open_seconds = max_open_seconds or config.LLM_CIRCUIT_MAX_OPEN_SECONDS
+        self.smoothing = smoothing or config.LLM_ROUTER_SMOOTHING
+        self._health = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def order(self, models):
+        # Models to try, best first: available models by score (unmeasured ones keep configured order),
+        # then models whose circuit reopens within LLM_BACKOFF_MAX_SECONDS (e.g. a short Retry-After),
+        # soonest first. Models with a longer open circuit are skipped; empty when every circuit is open.
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            unavailable = []
+            for index, model in enumerate(models):
+                health = self._get(model)
+                if health.state == OPEN and health.open_until <= now:
+                    health.state = HALF_OPEN
+                    health.trial_in_flight = False
+
+                if health.state == CLOSED or (health.state == HALF_OPEN and not health.trial_in_flight):
+                    available.append((self._score(health), index, model))
+                elif health.open_until - now <= config.LLM_BACKOFF_MAX_SECONDS:
+                    unavailable.append((health.open_until, index, model))
+
+            return [model for *_, model in sorted(available)] + [model for *_, model in sorted(unavailable)]
+
+    def before_attempt(self, model):
+        # Mark the single trial request allowed through a half-open circuit
+        with self._lock:
+            health = self._get(model)
+            if health.state == HALF_OPEN:
+                health.trial_in_flight = True
+
+    def record_success(self, model, latency):
+        with self._lock:
+            health = self._get(model)
+            health.latency = latency if health.latency is None else (
+                self.smoothing * latency + (1 - self.smoothing) * health.latency
+            )
+            health.error_rate *= 1 - self.smoothing
+            health.consecutive_failures = 0
+            health.state = CLOSED
+            health.open_seconds = self.open_seconds
+            health.trial_in_flight = False
+
+    def record_failure(self, model, error):
+        # Open the circuit on rate limiting (for Retry-After if given), after repeated failures,
+        # or when a half-open trial fails (with doubled open time)
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(model)
+            health.error_rate = self.smoothing + (1 - self.smoothing) * health.error_rate
+            health.consecutive_failures += 1
+            health.trial_in_flight = False
+
+            if is_rate_limited(error):
+                retry_after = retry_after_seconds(error)
+                self._open(health, now, retry_after if retry_after is not None else self.open_seconds)
+            elif health.state == HALF_OPEN:
+                health.open_seconds = min(health.open_seconds * 2, self.max_open_seconds)
+                self._open(health, now, health.open_seconds)
+            elif health.consecutive_failures >= self.failure_threshold:
+                self._open(health, now, health.open_seconds)
+
+    def backoff_delay(self, attempt, next_model):
+        # Delay before the attempt-th call (0 for the first): jittered exponential backoff between retries,
+        # or the rest of the next model's short Retry-After, at most LLM_BACKOFF_MAX_SECONDS
+        base = config.LLM_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1) if attempt else 0.0
+        with self._lock:
+            delay = base * self._random.uniform(0.5, 1.0)
+            health = self._get(next_model)
+            if health.state == OPEN:
+                delay = max(delay, health.open_until - time.monotonic())
+        return min(max(delay, 0.0), config.LLM_BACKOFF_MAX_SECONDS)
+
+    def snapshot(self):
+        # Per-model health, e.g. for metrics
+        with self._lock:
+            return {
+                model: {
+                    "state": health.state,
+                    "latency": health.latency,
+                    "error_rate": health.error_rate,
+                    "consecutive_failures": health.consecutive_failures
+                }
+                for model, health in self._health.items()
+            }
+
+    def _open(self, health, now, seconds):
+        health.state = OPEN
+        health.open_until = max(health.open_until, now + min(seconds, self.max_open_seconds))
+
+    def _score(self, health):
+        # Lower is better: expected latency inflated by the recent error rate
+        if health.latency is None:
+            return 0.0
+        return health.latency * (1 + config.LLM_ROUTER_ERROR_PENALTY * health.error_rate)
+
+    def _get(self, model):
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(self.open_seconds)
+        return health
+
+
+def models_for_option(model_option):
+    # Return list of models to try based on selected option
+    if model_option == "Auto (tries multiple)":
+        return list(config.DEFAULT_MODELS)
+    return [model_option]
+
+
+def status_code(error):
+    # HTTP status of an API error, if it can be determined
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "raw_response", None), "status_code", None)
+    return code
+
+
+def is_rate_limited(error):
+    code = status_code(error)
+    if code is not None:
+        return code == 429
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "capacity" in message
+
+
+def retry_after_seconds(error):
+    # Retry-After header of an API error (seconds or HTTP date), or None
+    response = getattr(error, "raw_response", None) or getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Global router shared by all stages
+router = ModelRouter()
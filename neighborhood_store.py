@@ -0,0 +1,203 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+import config
+from neo4j_client import get_neo4j_client
+from cypher_compiler import SINGLE_ENTITY_TEMPLATE
+from instrumentation import metrics
+from triplet import Triplet, as_triplet
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+class NeighborhoodStore:
+    # Precomputed single-entity explorations (both directions) of popular entities, keyed by the
+    # lowercase search term. Each entry holds the first top_k triplets of SINGLE_ENTITY_TEMPLATE,
+    # so serving from the store returns what the live query would.
+
+    def __init__(self, top_k=None, path=None):
+        self.top_k = top_k or config.NEIGHBORHOOD_STORE_TOP_K
+        self.path = path if path is not None else config.NEIGHBORHOOD_STORE_PATH
+        self.built_at = None
+        self._neighborhoods = {}  # term -> tuple of Triplets
+        self._requests = Counter()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = False
+        self._wake = threading.Event()
+
+    def lookup(self, term, limit):
+        # Triplets of a single-entity exploration, or None if the store cannot answer it
+        neighborhood = self._neighborhoods.get(term) if limit <= self.top_k else None
+        metrics.inc("neighborhood_store_requests_total", help_text="Single-entity queries by store outcome",
+                    outcome="miss" if neighborhood is None else "hit")
+        if neighborhood is None:
+            return None
+        return list(neighborhood[:limit])
+
+    def record_request(self, term):
+        # Count single-entity explorations so frequently asked entities get precomputed
+        # Counting every distinct term would grow without bound; when over NEIGHBORHOOD_STORE_MAX_TRACKED,
+        # only the most requested half is kept.
+        with self._lock:
+            self._requests[term] += 1
+            if len(self._requests) > config.NEIGHBORHOOD_STORE_MAX_TRACKED:
+                self._requests = Counter(dict(self._requests.most_common(config.NEIGHBORHOOD_STORE_MAX_TRACKED // 2)))
+
+    def popular_entities(self):
+        # Configured hot entities first, then the most requested ones, up to NEIGHBORHOOD_STORE_MAX_ENTITIES
+        with self._lock:
+            requested = [term for term, _ in self._requests.most_common()]
+        terms = [entity.strip().lower() for entity in config.HOT_ENTITIES] + requested
+        return list(dict.fromkeys(term for term in terms if term))[:config.NEIGHBORHOOD_STORE_MAX_ENTITIES]
+
+    def build(self, client=None, entities=None):
+        # Query the neighborhoods of the popular entities and swap them in; returns the number stored.
+        # Neighborhoods are read past the result cache, which may still hold results from before a reload.
+        client = client or get_neo4j_client()
+        run_query = getattr(client, "stream_query", client.execute_query)
+        neighborhoods = {}
+        for term in entities if entities is not None else self.popular_entities():
+            triplets = run_query(SINGLE_ENTITY_TEMPLATE, {"entity": term, "limit": self.top_k})
+            neighborhoods[term] = tuple(as_triplet(triplet) for triplet in triplets)
+
+        self._neighborhoods = neighborhoods
+        self.built_at = time.time()
+        metrics.set_gauge("neighborhood_store_entities", len(neighborhoods),
+                          help_text="Entities served from the neighborhood store")
+        return len(neighborhoods)
+
+    def save(self, path=None):
+        # Write the store as gzipped JSON with a shared string table (names repeat across entities)
+        path = path or self.path
+        strings = {}
+        entities = {}
+        for term, triplets in self._neighborhoods.items():
+            entities[term] = [
+                [strings.setdefault(value, len(strings)) for value in triplet] for triplet in triplets
+            ]
+
+        data = {
+            "version": FORMAT_VERSION,
+            "built_at": self.built_at,
+            "top_k": self.top_k,
+            "strings": list(strings),
+            "entities": entities
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def load(self, path=None):
+        # Load a saved store; returns False if there is none or it does not match the configuration
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION or data.get("top_k") != self.top_k:
+            return False
+
+        strings = [sys.intern(value) for value in data["strings"]]
+        self._neighborhoods = {
+            term: tuple(Triplet(*(strings[index] for index in triplet)) for triplet in triplets)
+            for term, triplets in data["entities"].items()
+        }
+        self.built_at = data.get("built_at")
+        metrics.set_gauge("neighborhood_store_entities", len(self._neighborhoods),
+                          help_text="Entities served from the neighborhood store")
+        return True
+
+    def invalidate(self):
+        # Stop serving the stored neighborhoods (e.g. after a graph reload) and rebuild them now
+        self._neighborhoods = {}
+        self.built_at = None
+        metrics.set_gauge("neighborhood_store_entities", 0, help_text="Entities served from the neighborhood store")
+        self._wake.set()
+
+    def start_refresher(self, interval=None):
+        # Rebuild (and save) in a background thread now if the store is empty or stale, then periodically
+        interval = interval or config.NEIGHBORHOOD_STORE_REFRESH_SECONDS
+        if self._refresher is not None:
+            return
+
+        def refresh_loop():
+            delay = 0
+            if self.built_at is not None:
+                delay = max(0, self.built_at + interval - time.time())
+            while True:
+                self._wake.wait(delay)
+                self._wake.clear()
+                if self._stop:
+                    return
+                try:
+                    self.build()
+                    if self.path:
+                        self.save()
+                except Exception as e:
+                    logger.warning("Neighborhood store refresh failed: %s", e)
+                delay = interval
+
+        self._refresher = threading.Thread(target=refresh_loop, name="neighborhood-store", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop = True
+        self._wake.set()
+
+
+# Global store (loaded lazily)
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_neighborhood_store():
+    # Store loaded from NEIGHBORHOOD_STORE_PATH, kept fresh by a background thread
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = NeighborhoodStore()
+            try:
+                store.load()
+            except Exception as e:
+                logger.warning("Could not load neighborhood store: %s", e)
+            store.start_refresher()
+            _store = store
+    return _store
+
+
+def invalidate_neighborhood_store():
+    # Drop and rebuild the global store if it has been loaded
+    if _store is not None:
+        _store.invalidate()
+
+
+def main():
+    # Build the store once and write it to disk (e.g. from a deployment job)
+    parser = argparse.ArgumentParser(description="Precompute neighborhoods of popular entities")
+    parser.add_argument("--path", default=config.NEIGHBORHOOD_STORE_PATH)
+    parser.add_argument("--top-k", type=int, default=config.NEIGHBORHOOD_STORE_TOP_K,
+                        help="Triplets stored per entity")
+    parser.add_argument("--entity", action="append", help="Entity to include (default: HOT_ENTITIES)")
+    args = parser.parse_args()
+
+    store = NeighborhoodStore(top_k=args.top_k, path=args.path)
+    count = store.build(entities=[entity.lower() for entity in args.entity] if args.entity else None)
+    store.save()
+    print(f"Stored neighborhoods of {count} entities in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
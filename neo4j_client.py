@@ -1,62 +1,269 @@
-from neo4j import GraphDatabase
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from neo4j import GraphDatabase, Query
 import config
+import cancellation
+from cache import TieredCache
+from triplet import Triplet, as_triplet, FIELDS
+from instrumentation import record_query, metrics
+
+logger = logging.getLogger(__name__)
+
+# Node labels whose names get a lowercase text index (see bootstrap_schema)
+INDEXED_LABELS = ("Source", "Destination")
+
+# Nodes whose name contains a term, exact matches first (seeds of a subgraph expansion)
+FIND_NODES_QUERY = """MATCH (n)
+WHERE (n:Source OR n:Destination) AND toLower(n.name) CONTAINS $term
+WITH DISTINCT n.name AS name
+RETURN name
+ORDER BY toLower(name) <> $term, size(name)
+LIMIT $limit"""
+
+# One BFS hop: up to $fanout edges (either direction, optionally of matching types) per frontier node.
+# Frontier names are exact node names, looked up through the name indexes created by bootstrap_schema.
+EXPAND_FRONTIER_QUERY = """UNWIND $names AS name
+CALL {
+  WITH name
+  MATCH (n)-[r:TO]-()
+  WHERE (n:Source OR n:Destination) AND n.name = name
+    AND (size($relations) = 0 OR any(term IN $relations WHERE toLower(r.type) CONTAINS term))
+  RETURN r
+  LIMIT $fanout
+}
+RETURN startNode(r).name AS source, r.type AS relation, endNode(r).name AS destination"""
+
+# Quoted string literals, kept verbatim when normalizing query text
+_STRING_LITERAL = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")")
+
+# RETURN n, r, m of the query templates, projected to the three values a triplet needs
+_RETURN_NODES = re.compile(r"\bRETURN\s+(DISTINCT\s+)?n\s*,\s*r\s*,\s*m\b(?!\s*[.,(\[])", re.IGNORECASE)
+
+# toLower(x.name) predicates that the name_lower text index can serve
+_TO_LOWER_NAME = re.compile(r"toLower\(\s*(\w+)\.name\s*\)", re.IGNORECASE)
 
 class Neo4jClient:
     # Client for interacting with Neo4j database
 
-    def __init__(self, uri=None, username=None, password=None):
+    def __init__(self, uri=None, username=None, password=None, cache=None):
         # Initialize Neo4j connection with credentials from config or parameters
         self.uri = uri or config.NEO4J_URI
         self.username = username or config.NEO4J_USERNAME
         self.password = password or config.NEO4J_PASSWORD
         self.driver = None
+        self.cache = cache
+        self._query_shapes = Counter()
+        self._shapes_lock = threading.Lock()
+        # Client-side view of the driver pool: one slot per connection, for saturation and wait metrics
+        self._pool_size = config.NEO4J_MAX_POOL_SIZE
+        self._pool_slots = threading.BoundedSemaphore(self._pool_size)
+        self._pool_in_use = 0
+        self._pool_lock = threading.Lock()
+        self._monitor = None
+        self._monitor_stop = threading.Event()
 
     def connect(self):
-        # Establish connection to Neo4j database
+        # Establish connection to Neo4j database with the configured pool settings
         self.driver = GraphDatabase.driver(
             self.uri,
-            auth=(self.username, self.password)
+            auth=(self.username, self.password),
+            max_connection_pool_size=self._pool_size,
+            connection_acquisition_timeout=config.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+            max_connection_lifetime=config.NEO4J_MAX_CONNECTION_LIFETIME,
+            liveness_check_timeout=config.NEO4J_LIVENESS_CHECK_TIMEOUT,
+            connection_timeout=config.NEO4J_CONNECTION_TIMEOUT
         )
 
     def close(self):
-        # Close database connection
+        # Stop the health monitor and close database connection
+        self._monitor_stop.set()
         if self.driver:
             self.driver.close()
 
-    def execute_query(self, cypher_query):
-        # Execute Cypher query and return triplets as list of dicts
-        triplets = []
+    def reconnect(self):
+        # Replace the driver (and its pool) after the connection was lost
+        old_driver = self.driver
+        self.connect()
+        metrics.inc("neo4j_reconnects_total", help_text="Driver recreations after failed health checks")
+        if old_driver is not None:
+            try:
+                old_driver.close()
+            except Exception:
+                pass
+
+    def warm_up(self, connections=None):
+        # Open pool connections ahead of the first question by running concurrent no-op queries;
+        # returns True if the database answered
+        connections = max(1, connections or config.NEO4J_WARM_UP_CONNECTIONS)
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="neo4j-warm-up") as executor:
+            results = list(executor.map(lambda _: self.test_connection(), range(connections)))
+        return any(results)
 
+    def start_health_monitor(self, interval=None):
+        # Check liveness periodically in a daemon thread and recreate the driver when the check fails
+        interval = interval or config.NEO4J_HEALTH_CHECK_INTERVAL
+        if self._monitor is not None or not interval:
+            return
+
+        def monitor():
+            while not self._monitor_stop.wait(interval):
+                if self.pool_stats()["in_use"] >= self._pool_size:
+                    continue  # every connection is busy serving queries, so the database is reachable
+                healthy = self.test_connection()
+                if not healthy:
+                    try:
+                        self.reconnect()
+                        healthy = self.test_connection()
+                    except Exception as e:
+                        logger.warning("Neo4j reconnect failed: %s", e)
+                metrics.set_gauge("neo4j_up", 1 if healthy else 0, help_text="Result of the last Neo4j health check")
+
+        self._monitor = threading.Thread(target=monitor, name="neo4j-health", daemon=True)
+        self._monitor.start()
+
+    def pool_stats(self):
+        # Sessions currently holding a connection, out of the pool size
+        with self._pool_lock:
+            return {"in_use": self._pool_in_use, "max_size": self._pool_size}
+
+    @contextmanager
+    def _session(self):
+        # Driver session counted against the pool; waits are timed and bounded by the acquisition timeout
+        started = time.perf_counter()
+        if not self._pool_slots.acquire(timeout=cancellation.time_left(config.NEO4J_CONNECTION_ACQUISITION_TIMEOUT)):
+            metrics.inc("neo4j_pool_acquisition_timeouts_total",
+                        help_text="Sessions that could not get a pooled connection in time")
+            raise Exception("Timed out waiting for a Neo4j connection")
+        metrics.observe("neo4j_pool_wait_seconds", time.perf_counter() - started,
+                        help_text="Time waited for a pooled connection")
+        self._update_pool_usage(1)
         try:
             with self.driver.session() as session:
-                result = session.run(cypher_query)
-                records = list(result)
+                yield session
+        finally:
+            self._update_pool_usage(-1)
+            self._pool_slots.release()
 
-                for record in records:
-                    try:
-                        if 'n' in record.keys() and 'r' in record.keys() and 'm' in record.keys():
-                            n = record['n']
-                            m = record['m']
-                            r = record['r']
-
-                            s_name = self._extract_name(n)
-                            d_name = self._extract_name(m)
-                            r_type = self._extract_type(r)
-
-                            if s_name and d_name:
-                                triplets.append({
-                                    'source': s_name,
-                                    'relation': r_type,
-                                    'destination': d_name
-                                })
-                    except Exception:
-                        continue
+    def _update_pool_usage(self, delta):
+        with self._pool_lock:
+            self._pool_in_use += delta
+            in_use = self._pool_in_use
+        metrics.set_gauge("neo4j_pool_in_use", in_use, help_text="Sessions holding a pooled connection")
+        metrics.set_gauge("neo4j_pool_utilization", in_use / self._pool_size,
+                          help_text="Share of the connection pool in use")
+
+    def execute_query(self, cypher_query, parameters=None):
+        # Execute (parameterized) Cypher query and return triplets as list of dicts, served from cache when possible
+        started = time.perf_counter()
+
+        if self.cache is not None:
+            key = _cache_key(cypher_query, parameters)
+            found, triplets = self.cache.get(key)
+            if found:
+                # The disk tier returns JSON lists (or dicts written by older versions)
+                triplets = [as_triplet(triplet) for triplet in triplets]
+                record_query(len(triplets), time.perf_counter() - started, cache_hit=True)
+                return triplets
 
+        try:
+            triplets = list(self.stream_query(cypher_query, parameters))
         except Exception as e:
-            raise Exception(f"Database error: {str(e)}")
+            record_query(0, time.perf_counter() - started, error=e)
+            raise
+        record_query(len(triplets), time.perf_counter() - started)
 
+        if self.cache is not None:
+            self.cache.set(key, triplets)
         return triplets
 
+    def invalidate_cache(self):
+        # Drop all cached results, e.g. after the graph has been reloaded
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def cache_stats(self):
+        # Hit/miss counters of the result cache (None when caching is disabled)
+        return self.cache.stats() if self.cache is not None else None
+
+    def query_shape_stats(self, top=10):
+        # Distinct query texts sent to the server; few shapes over many executions means plans are reused
+        with self._shapes_lock:
+            executions = sum(self._query_shapes.values())
+            return {
+                "distinct_shapes": len(self._query_shapes),
+                "executions": executions,
+                "most_common": self._query_shapes.most_common(top)
+            }
+
+    def stream_query(self, cypher_query, parameters=None):
+        # Run Cypher query and yield Triplets as records arrive (uncached). RETURN n, r, m is projected
+        # to names and type only, so whole nodes and their properties are never transferred.
+        # The server aborts the transaction after NEO4J_TRANSACTION_TIMEOUT (or when the request's
+        # time is up); a cancelled request stops reading and releases the connection.
+        with self._shapes_lock:
+            self._query_shapes[normalize_cypher(cypher_query)] += 1
+
+        try:
+            with self._session() as session:
+                query = Query(project_triplet_return(cypher_query),
+                              timeout=cancellation.time_left(config.NEO4J_TRANSACTION_TIMEOUT))
+                result = session.run(query, parameters or {})
+                keys = result.keys()
+
+                if all(field in keys for field in FIELDS):
+                    # Projected query: plain values by position
+                    positions = [keys.index(field) for field in FIELDS]
+                    for record in result:
+                        cancellation.check_cancelled()
+                        source, relation, destination = (record[i] for i in positions)
+                        if source and destination:
+                            yield Triplet(source, relation if relation is not None else 'RELATED', destination)
+
+                elif 'n' in keys and 'r' in keys and 'm' in keys:
+                    # Query returning whole nodes and relationship
+                    for record in result:
+                        cancellation.check_cancelled()
+                        try:
+                            s_name = self._extract_name(record['n'])
+                            d_name = self._extract_name(record['m'])
+                            r_type = self._extract_type(record['r'])
+                        except Exception:
+                            continue
+                        if s_name and d_name:
+                            yield Triplet(s_name, r_type, d_name)
+
+        except cancellation.RequestCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Database error: {str(e)}")
+
+    def estimate_rows(self, cypher_query, parameters=None):
+        # Largest row count the planner expects at any operator of the query (EXPLAIN does not run it)
+        with self._session() as session:
+            summary = session.run("EXPLAIN " + project_triplet_return(cypher_query), parameters or {}).consume()
+        return _max_estimated_rows(summary.plan) if summary.plan else None
+
+    def find_nodes(self, term, limit):
+        # Names of nodes whose lowercase name contains term, exact matches and shorter names first
+        cypher = rewrite_for_name_index(FIND_NODES_QUERY) if config.USE_NAME_LOWER_INDEX else FIND_NODES_QUERY
+        with self._session() as session:
+            query = Query(cypher, timeout=cancellation.time_left(config.NEO4J_TRANSACTION_TIMEOUT))
+            result = session.run(query, {"term": term, "limit": limit})
+            return [record["name"] for record in result]
+
+    def expand_frontier(self, names, relations, fanout):
+        # Edges of the named nodes for one hop of a subgraph expansion, at most fanout per node
+        return list(self.stream_query(
+            EXPAND_FRONTIER_QUERY, {"names": list(names), "relations": list(relations), "fanout": fanout}
+        ))
+
     def _extract_name(self, node):
         # Extract name from node
         if hasattr(node, 'get'):
@@ -77,22 +284,153 @@ class Neo4jClient:
         # True if connection successful, False otherwise
 
         try:
-            with self.driver.session() as session:
+            with self._session() as session:
                 result = session.run("RETURN 1 as test")
                 record = result.single()
                 return record["test"] == 1
         except Exception:
             return False
 
+    def fetch_entity_names(self):
+        # Distinct names of all Source and Destination nodes
+        with self._session() as session:
+            result = session.run(
+                "MATCH (n) WHERE n:Source OR n:Destination "
+                "RETURN DISTINCT n.name AS name"
+            )
+            return [record["name"] for record in result if record["name"]]
+
+    def iter_triplets(self):
+        # Stream every (source, relation, destination) of the graph, e.g. to export a snapshot
+        with self._session() as session:
+            result = session.run(
+                "MATCH (n:Source)-[r:TO]->(m:Destination) "
+                "RETURN n.name AS source, r.type AS relation, m.name AS destination"
+            )
+            for record in result:
+                yield record["source"], record["relation"], record["destination"]
+
+    def bootstrap_schema(self, batch_size=None):
+        # Store lowercase names in a name_lower property and index it on both node labels,
+        # so CONTAINS lookups can use a text index instead of scanning every node. Exact names
+        # get a range index for the frontier lookups of subgraph expansions.
+        # Idempotent: rerun after each graph reload to fill in new nodes.
+        batch_size = int(batch_size or config.SCHEMA_BOOTSTRAP_BATCH_SIZE)
+        updated = {}
+
+        with self._session() as session:
+            for label in INDEXED_LABELS:
+                result = session.run(
+                    f"MATCH (n:{label}) "
+                    "WHERE n.name IS NOT NULL AND (n.name_lower IS NULL OR n.name_lower <> toLower(n.name)) "
+                    f"CALL {{ WITH n SET n.name_lower = toLower(n.name) }} IN TRANSACTIONS OF {batch_size} ROWS"
+                )
+                updated[label] = result.consume().counters.properties_set
+
+                session.run(
+                    f"CREATE TEXT INDEX {label.lower()}_name_lower IF NOT EXISTS "
+                    f"FOR (n:{label}) ON (n.name_lower)"
+                ).consume()
+                session.run(
+                    f"CREATE RANGE INDEX {label.lower()}_name IF NOT EXISTS FOR (n:{label}) ON (n.name)"
+                ).consume()
+
+            session.run("CALL db.awaitIndexes()").consume()
+
+        # Cached results were computed against the previous graph state
+        self.invalidate_cache()
+        return updated
+
+
+def project_triplet_return(cypher_query):
+    # Replace RETURN n, r, m with n.name AS source, r.type AS relation, m.name AS destination
+    return _RETURN_NODES.sub(
+        lambda match: f"RETURN {match.group(1) or ''}n.name AS source, r.type AS relation, m.name AS destination",
+        cypher_query
+    )
+
+
+def rewrite_for_name_index(cypher_query):
+    # Replace toLower(n.name) with the indexed n.name_lower property created by bootstrap_schema
+    return _TO_LOWER_NAME.sub(lambda match: f"{match.group(1)}.name_lower", cypher_query)
+
+
+def _max_estimated_rows(plan):
+    # Maximum EstimatedRows over an EXPLAIN plan tree
+    rows = plan.get("args", {}).get("EstimatedRows", 0)
+    return max([rows] + [_max_estimated_rows(child) for child in plan.get("children", [])])
+
+
+def normalize_cypher(cypher_query):
+    # Collapse whitespace outside string literals so formatting differences map to the same text
+    parts = _STRING_LITERAL.split(cypher_query.strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    )
+
+
+def _cache_key(cypher_query, parameters=None):
+    # Hash of normalized query text plus parameters
+    payload = json.dumps([normalize_cypher(cypher_query), parameters or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _build_query_cache():
+    # Result cache configured from config (None when disabled)
+    if not config.QUERY_CACHE_ENABLED:
+        return None
+    return TieredCache(
+        max_entries=config.QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds=config.QUERY_CACHE_TTL_SECONDS,
+        db_path=config.QUERY_CACHE_DB_PATH or None,
+        namespace="query_results"
+    )
+
 
 # Global client instance
 _client_instance = None
+_client_lock = threading.Lock()
 
 
 def get_neo4j_client():
-    # Neo4jClient instance
+    # Neo4jClient instance, created once with a warmed-up pool and health monitoring
     global _client_instance
-    if _client_instance is None:
-        _client_instance = Neo4jClient()
-        _client_instance.connect()
-    return _client_instance
\ No newline at end of file
+    with _client_lock:
+        if _client_instance is None:
+            if config.GRAPH_SNAPSHOT_PATH:
+                # Serve template queries from the memory-mapped snapshot, anything else from Neo4j.
+                # Imported here so NumPy is only needed when a snapshot is configured.
+                from graph_snapshot import SnapshotClient
+
+                client = SnapshotClient(config.GRAPH_SNAPSHOT_PATH, fallback=_connect_neo4j)
+                client.connect()
+            else:
+                client = _connect_neo4j()
+            _client_instance = client
+    return _client_instance
+
+
+def _connect_neo4j():
+    # Connected Neo4jClient with the configured result cache, pool warm-up and health monitor
+    client = Neo4jClient(cache=_build_query_cache())
+    client.connect()
+    client.warm_up()
+    client.start_health_monitor()
+    return client
+
+
+def set_neo4j_client(client):
+    # Replace the global client, e.g. with an in-memory stand-in for benchmarks
+    global _client_instance
+    _client_instance = client
+
+
+def invalidate_query_cache():
+    # Invalidate cached results of the global client (and the neighborhoods precomputed from them)
+    # after a graph reload
+    from neighborhood_store import invalidate_neighborhood_store
+
+    if _client_instance is not None:
+        _client_instance.invalidate_cache()
+    invalidate_neighborhood_store()
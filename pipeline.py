@@ -0,0 +1,211 @@
+import contextlib
+import re
+import config
+from cancellation import CancellationToken, cancellation_scope, current_token, check_cancelled, iterate_in_scope
+from instrumentation import start_trace, span, trace_stream, metrics
+from query_classifier import classify_question
+from deep_analysis import deep_analysis_of_question, classify_and_analyze
+from query_generator import generate_multiple_cypher_queries
+from query_executor import execute_multiple_queries, prefetch_queries
+from cypher_compiler import exploration_queries
+from response_generator import (
+    synthesize_comprehensive_answer, generate_direct_answer, stream_comprehensive_answer, stream_direct_answer
+)
+from entity_gazetteer import get_gazetteer, build_gazetteer_analysis
+
+# Pipeline phases reported to the status hook
+PHASES = ("classification", "analysis", "query_generation", "query_execution", "synthesis", "direct_answer")
+
+# Phases whose answer is returned as a stream when stream=True
+STREAMED_PHASES = ("synthesis", "direct_answer")
+
+# Gene/protein-like symbols (BRCA1, HER2, PI3K) used as prefetch candidates when the gazetteer finds none
+_SYMBOL = re.compile(r"\b[A-Z][A-Z0-9-]*[0-9A-Z]\b")
+
+def process_query_with_deep_reasoning(client, question, conversation_history=None, model_option="Auto (tries multiple)",
+                                      fused_analysis=None, stream=False, status=None, cancel_token=None):
+    # Run the five-phase pipeline. With stream=True the returned answer is a generator of text chunks.
+    # status(phase, message) returns a context manager wrapped around each phase (e.g. a Streamlit
+    # spinner); message is None for phases that run without a progress indicator.
+    # cancel_token (default: the caller's current token) is checked before every phase and bounds the
+    # timeouts of all queries and LLM calls; when the request fails or is abandoned it is cancelled,
+    # which stops the work still running on worker threads.
+    # Each request is recorded as a trace with one span per phase.
+    if fused_analysis is None:
+        fused_analysis = config.FUSED_ANALYSIS_MODE
+    status = _traced_status(status or _no_status, STREAMED_PHASES if stream else ())
+    token = cancel_token or current_token() or CancellationToken()
+
+    with cancellation_scope(token), \
+            start_trace("pipeline", question=question[:200], model_option=model_option) as trace:
+        # Speculative queries run on the worker pool while the LLM stages below are waited on
+        prefetched = _start_prefetch(question) if config.SPECULATIVE_PREFETCH else None
+        try:
+            answer, source_type, metadata = _run_pipeline(
+                client, question, conversation_history, model_option, fused_analysis, stream, status, prefetched
+            )
+        except BaseException:
+            token.cancel("abandoned")
+            raise
+        finally:
+            if prefetched is not None:
+                prefetched.discard()
+        trace.attributes["source_type"] = source_type
+        # A streamed answer is read after this returns: the trace stays open until it has been
+        trace.keep_open = not isinstance(answer, str)
+
+    if not isinstance(answer, str):
+        # Keep the request's trace and token current while the stream is read
+        phase = "synthesis" if source_type == "graph_multi_query" else "direct_answer"
+        answer = iterate_in_scope(token, trace_stream(trace, answer, phase))
+
+    metrics.inc("pipeline_requests_total", help_text="Answered questions by answer source", source_type=source_type)
+    return answer, source_type, metadata
+
+
+def _run_pipeline(client, question, conversation_history, model_option, fused_analysis, stream, status,
+                  prefetched=None):
+
+    direct_answer = stream_direct_answer if stream else generate_direct_answer
+    synthesize_answer = stream_comprehensive_answer if stream else synthesize_comprehensive_answer
+
+    known_entities = _match_known_entities(question) if config.GAZETTEER_SHORTCUT_ANALYSIS else []
+
+    if known_entities:
+        # PHASES 1+2: Question names entities that exist in the graph - no LLM classification/analysis needed
+        analysis = build_gazetteer_analysis(known_entities)
+    elif fused_analysis:
+        # PHASES 1+2: Classification and deep analysis from a single LLM call
+        with status("analysis", "Analyzing question deeply..."):
+            query_type, analysis = classify_and_analyze(client, question, conversation_history, model_option)
+
+        if query_type == "DIRECT":
+            answer = _answer_directly(
+                prefetched, direct_answer, status, client, question, conversation_history, model_option
+            )
+            return answer, "direct", None
+    else:
+        # PHASE 1: Initial classification
+        with status("classification", None):
+            query_type = classify_question(client, question, model_option)
+
+        if query_type == "DIRECT":
+            # Question doesn't require graph search - provide direct answer
+            answer = _answer_directly(
+                prefetched, direct_answer, status, client, question, conversation_history, model_option
+            )
+            return answer, "direct", None
+
+        # PHASE 2: Deep analysis of the question
+        # This is where the AI "thinks deeply" about the question
+        with status("analysis", "Analyzing question deeply..."):
+            analysis = deep_analysis_of_question(client, question, conversation_history, model_option)
+
+    # Don't generate queries for entities that do not exist in the graph
+    if config.GAZETTEER_ENABLED:
+        analysis["entities"] = _filter_known_entities(analysis["entities"])
+
+    # Check if analysis determined no graph search is needed
+    if analysis["query_strategy"] == "no_graph_needed" or not analysis["entities"]:
+        answer = _answer_directly(
+            prefetched, direct_answer, status, client, question, conversation_history, model_option
+        )
+        return answer, "direct", analysis
+
+    # PHASE 3: Generate multiple strategic queries based on analysis
+    with status("query_generation", "Planning query strategy..."):
+        queries_list = generate_multiple_cypher_queries(client, question, analysis, conversation_history, model_option)
+
+    if not queries_list:
+        # Fallback to direct answer if no queries generated
+        answer = _answer_directly(
+            prefetched, direct_answer, status, client, question, conversation_history, model_option
+        )
+        return answer, "direct", analysis
+
+    # PHASE 4: Execute all queries and collect results
+    with status("query_execution", f"Executing {len(queries_list)} targeted queries..."):
+        query_results = execute_multiple_queries(queries_list, prefetched=prefetched)
+    # Free the query workers from speculative queries the plan did not use before synthesis
+    if prefetched is not None:
+        prefetched.discard()
+
+    if not query_results or all(result['count'] == 0 for result in query_results):
+        # No results found - provide direct answer
+        answer = _answer_directly(
+            prefetched, direct_answer, status, client, question, conversation_history, model_option
+        )
+        return answer, "direct", analysis
+
+    # PHASE 5: Synthesize comprehensive answer from all results
+    with status("synthesis", "Synthesizing comprehensive answer..."):
+        answer = synthesize_answer(
+            client, question, analysis, query_results, conversation_history, model_option
+        )
+
+    return answer, "graph_multi_query", {
+        "analysis": analysis,
+        "queries_executed": len(queries_list),
+        "queries": queries_list,
+        "total_results": sum(r['count'] for r in query_results)
+    }
+
+
+def _start_prefetch(question):
+    # Start the single-entity explorations the compiler would plan for the entities the question most
+    # likely names; None if there are no candidates. Only these cheap template queries are guessed:
+    # a started query cannot be stopped, so a wrong guess must not hold the query workers for long.
+    candidates = _match_known_entities(question) or list(dict.fromkeys(_SYMBOL.findall(question)))
+    if not candidates:
+        return None
+    try:
+        return prefetch_queries(exploration_queries(candidates)[:config.SPECULATIVE_PREFETCH_MAX_QUERIES])
+    except Exception:
+        return None
+
+
+def _match_known_entities(question):
+    # Graph entities found in the question by the gazetteer (empty if it is disabled or unavailable)
+    if not config.GAZETTEER_ENABLED:
+        return []
+    try:
+        return get_gazetteer().find_entities(question)
+    except Exception:
+        return []
+
+
+def _filter_known_entities(entities):
+    # Keep entities that exist in the graph; leave them untouched if the gazetteer is unavailable
+    try:
+        return get_gazetteer().filter_known(entities)
+    except Exception:
+        return entities
+
+
+def _answer_directly(prefetched, direct_answer, status, client, question, conversation_history, model_option):
+    # Direct answer without graph search, timed as its own phase. Unused speculative queries are
+    # dropped first, so they do not hold the query workers while the answer is generated.
+    if prefetched is not None:
+        prefetched.discard()
+    with status("direct_answer", None):
+        return direct_answer(client, question, conversation_history, model_option)
+
+
+def _traced_status(status, streamed_phases=()):
+    # Wrap a status hook so every phase is also recorded as a span, and not started once cancelled.
+    # Streamed phases only create the answer stream here; their span covers reading it (trace_stream).
+    @contextlib.contextmanager
+    def traced(phase, message):
+        check_cancelled()
+        if phase in streamed_phases:
+            with status(phase, message):
+                yield
+            return
+        with span(phase), status(phase, message):
+            yield
+    return traced
+
+
+def _no_status(phase, message):
+    # Default status hook: no progress display
+    return contextlib.nullcontext()
@@ -1,5 +1,5 @@
-import time
 import config
+from llm_client import complete_with_fallback, AllModelsFailedError
 
 def classify_question(client, question, model_option="Auto (tries multiple)"):
     # Classify question type: "GRAPH" for knowledge graph search or "DIRECT" for general answer
@@ -22,28 +22,13 @@ RESPOND WITH ONLY: "GRAPH" or "DIRECT"
 """
 
     messages = [{'role': 'user', 'content': prompt}]
-    models_to_try = _get_models_list(model_option)
-
-    for model in models_to_try:
-        try:
-            response = client.chat.complete(
-                model=model,
-                messages=messages,
-                temperature=config.CLASSIFICATION_TEMPERATURE
-            )
-            classification = response.choices[0].message.content.strip().upper()
-            return "GRAPH" if "GRAPH" in classification else "DIRECT"
-        except Exception:
-            if model == models_to_try[-1]:
-                return "DIRECT"  # Default to direct answer if all models fail
-            time.sleep(1)
-            continue
-
-    return "DIRECT"
-
-def _get_models_list(model_option):
-    # Get model list based on selected option (auto fallback or single model)
-    if model_option == "Auto (tries multiple)":
-        return config.DEFAULT_MODELS
-    else:
-        return [model_option]
\ No newline at end of file
+
+    try:
+        classification = complete_with_fallback(
+            client, messages, config.CLASSIFICATION_TEMPERATURE, "classification", model_option
+        )
+    except AllModelsFailedError:
+        return "DIRECT"  # Default to direct answer if all models fail
+
+    classification = classification.strip().upper()
+    return "GRAPH" if "GRAPH" in classification else "DIRECT"
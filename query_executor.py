@@ -1,26 +1,88 @@
-from neo4j_client import get_neo4j_client
+from concurrent.futures import ThreadPoolExecutor, wait, TimeoutError as FutureTimeoutError
+import json
+import threading
+import config
+import cancellation
+from neo4j_client import get_neo4j_client, rewrite_for_name_index
+from neighborhood_store import get_neighborhood_store
+from cypher_compiler import SINGLE_ENTITY_TEMPLATE
+from cypher_guard import guard_query, CypherRejected
+from subgraph_expander import expand_paths
+from instrumentation import bind_context, metrics
 
-def execute_multiple_queries(queries_list):
+# Shared worker pool for concurrent query execution
+_executor = None
+_executor_lock = threading.Lock()
 
-    all_results = []
-    seen_triplets = set()  # To avoid duplicates
 
-    neo4j_client = get_neo4j_client()
+class PrefetchedQueries:
+    # Speculatively started queries, keyed by query text and parameters. Queries of the final plan
+    # take over matching futures; whatever is left is discarded.
 
-    for query_obj in queries_list:
-        purpose = query_obj.get("purpose", "Unknown purpose")
-        cypher = query_obj.get("cypher", "")
+    def __init__(self, futures):
+        self._futures = futures
+        self._lock = threading.Lock()
+
+    def take(self, query_obj):
+        # Future of an identical prefetched query, or None
+        with self._lock:
+            future = self._futures.pop(_query_key(query_obj), None)
+        if future is not None:
+            metrics.inc("speculative_queries_total", help_text="Speculatively prefetched queries by outcome",
+                        outcome="used")
+        return future
+
+    def discard(self):
+        # Cancel (or drop the results of) prefetched queries the plan did not use
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.cancel()
+        if futures:
+            metrics.inc("speculative_queries_total", len(futures), outcome="discarded")
 
-        if not cypher:
+
+def prefetch_queries(queries_list):
+    # Start queries on the worker pool before the plan is known, e.g. while LLM stages run
+    neo4j_client = get_neo4j_client()
+    executor = _get_executor()
+    futures = {}
+    for query_obj in queries_list:
+        if not isinstance(query_obj, dict):
             continue
+        key = _query_key(query_obj)
+        if key not in futures:
+            futures[key] = executor.submit(bind_context(_run_query), neo4j_client, query_obj)
+    return PrefetchedQueries(futures)
 
-        # Execute query
-        try:
-            triplets = neo4j_client.execute_query(cypher)
-        except Exception as e:
-            # Skip failed queries
+
+def execute_multiple_queries(queries_list, concurrent=None, prefetched=None):
+    # Execute generated queries (concurrently by default) and merge their triplets in query order.
+    # Queries already started by prefetch_queries reuse the speculative result.
+    if concurrent is None:
+        concurrent = config.CONCURRENT_QUERY_EXECUTION
+
+    neo4j_client = get_neo4j_client()
+    # Generated plans may contain entries that are not query objects at all
+    queries_list = [query_obj for query_obj in queries_list if isinstance(query_obj, dict)]
+
+    if concurrent and len(queries_list) > 1:
+        triplets_per_query = _run_queries_concurrently(neo4j_client, queries_list, prefetched)
+    else:
+        triplets_per_query = [_run_query_or_prefetched(neo4j_client, query_obj, prefetched)
+                              for query_obj in queries_list]
+
+    all_results = []
+    seen_triplets = set()  # To avoid duplicates
+
+    # Merge in the original query order so first-seen deduplication stays deterministic
+    for query_obj, triplets in zip(queries_list, triplets_per_query):
+        if triplets is None:
+            # Skip empty, failed or timed out queries
             continue
 
+        purpose = query_obj.get("purpose", "Unknown purpose")
+
         # Filter out duplicates
         unique_triplets = []
         for triplet in triplets:
@@ -40,6 +102,138 @@ def execute_multiple_queries(queries_list):
     return all_results
 
 
+def _run_query(neo4j_client, query_obj):
+    # Execute a single query object, returning None if it is empty, malformed or fails, so one bad
+    # generated query never fails the whole execution phase
+    try:
+        return _execute_query(neo4j_client, query_obj)
+    except cancellation.RequestCancelled:
+        raise
+    except Exception:
+        return None
+
+
+def _execute_query(neo4j_client, query_obj):
+    if "expand" in query_obj:
+        return _run_expansion(neo4j_client, query_obj["expand"])
+
+    cypher = query_obj.get("cypher", "")
+    if not cypher or not isinstance(cypher, str):
+        return None
+    cancellation.check_cancelled()
+
+    params = _query_parameters(query_obj)
+    if params is None:
+        return None
+    if config.NEIGHBORHOOD_STORE_ENABLED and cypher == SINGLE_ENTITY_TEMPLATE:
+        triplets = _serve_from_store(params)
+        if triplets is not None:
+            return triplets
+
+    if config.CYPHER_GUARD_ENABLED:
+        # Generated queries may write, expand without bound or omit LIMIT
+        try:
+            cypher, params = guard_query(cypher, params, neo4j_client)
+        except CypherRejected:
+            return None
+
+    if config.USE_NAME_LOWER_INDEX:
+        cypher = rewrite_for_name_index(cypher)
+
+    return neo4j_client.execute_query(cypher, params)
+
+
+def _run_expansion(neo4j_client, spec):
+    # Path triplets of a subgraph expansion query object
+    cancellation.check_cancelled()
+    return expand_paths(neo4j_client, spec)
+
+
+def _serve_from_store(params):
+    # Precomputed neighborhood for a plain single-entity exploration, or None to query the database
+    term = params.get("entity")
+    if not isinstance(term, str):
+        return None
+    try:
+        store = get_neighborhood_store()
+        store.record_request(term)
+        return store.lookup(term, params["limit"])
+    except Exception:
+        return None
+
+
+def _query_parameters(query_obj):
+    # Parameters of a query object, defaulting $limit to the configured maximum; None if they are not a map
+    params = query_obj.get("params") or {}
+    if not isinstance(params, dict):
+        return None
+    params = dict(params)
+    if "$limit" in str(query_obj.get("cypher", "")):
+        try:
+            params["limit"] = int(params.get("limit", config.MAX_QUERY_RESULTS))
+        except (TypeError, ValueError):
+            params["limit"] = config.MAX_QUERY_RESULTS
+    return params
+
+
+def _run_query_or_prefetched(neo4j_client, query_obj, prefetched):
+    # Sequential execution, waiting for a matching prefetched query instead of running it again
+    future = prefetched.take(query_obj) if prefetched is not None else None
+    if future is None:
+        return _run_query(neo4j_client, query_obj)
+    try:
+        return future.result(timeout=cancellation.time_left(config.QUERY_EXECUTION_TIMEOUT))
+    except FutureTimeoutError:
+        future.cancel()
+        cancellation.check_cancelled()
+        return None
+
+
+def _query_key(query_obj):
+    # Identity of a query for matching prefetched results: query text plus effective parameters
+    if "expand" in query_obj:
+        return "expand", json.dumps(query_obj["expand"], sort_keys=True, default=str)
+    params = json.dumps(_query_parameters(query_obj), sort_keys=True, default=str)
+    return str(query_obj.get("cypher", "")), params
+
+
+def _run_queries_concurrently(neo4j_client, queries_list, prefetched=None):
+    # Fan queries out to the worker pool; queries still running after the timeout are dropped
+    executor = _get_executor()
+    futures = []
+    for query_obj in queries_list:
+        future = prefetched.take(query_obj) if prefetched is not None else None
+        if future is None:
+            future = executor.submit(bind_context(_run_query), neo4j_client, query_obj)
+        futures.append(future)
+
+    wait(futures, timeout=cancellation.time_left(config.QUERY_EXECUTION_TIMEOUT))
+
+    triplets_per_query = []
+    for future in futures:
+        if future.done():
+            triplets_per_query.append(future.result())
+        else:
+            future.cancel()
+            triplets_per_query.append(None)
+
+    # Out of time for the whole request rather than for these queries
+    cancellation.check_cancelled()
+    return triplets_per_query
+
+
+def _get_executor():
+    # Lazily create the shared worker pool (the Neo4j driver is thread-safe, sessions are per query)
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.QUERY_EXECUTION_WORKERS,
+                thread_name_prefix="cypher-query"
+            )
+    return _executor
+
+
 def deduplicate_triplets(query_results, max_triplets=None):
     # Deduplicate triplets from multiple queries and limit to max_triplets
     unique_triplets = {}
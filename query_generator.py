@@ -1,6 +1,10 @@
 import json
-import time
 import config
+from conversation_context import build_conversation_context
+from llm_client import complete_with_fallback, AllModelsFailedError
+from cypher_compiler import (
+    compile_queries, expansion_queries, SINGLE_ENTITY_TEMPLATE, TWO_ENTITY_TEMPLATE, RELATIONSHIP_TEMPLATE
+)
 
 def generate_multiple_cypher_queries(client, question, analysis, conversation_history=None,
                                      model_option="Auto (tries multiple)"):
@@ -8,7 +12,13 @@ def generate_multiple_cypher_queries(client, question, analysis, conversation_hi
     if analysis["query_strategy"] == "no_graph_needed" or not analysis["entities"]:
         return []
 
-    context = _build_conversation_context(conversation_history)
+    # Compile the templates locally; the LLM is only needed for analyses the compiler cannot handle
+    if config.USE_CYPHER_COMPILER:
+        compiled_queries = compile_queries(analysis)
+        if compiled_queries:
+            return compiled_queries
+
+    context = build_conversation_context(conversation_history, "query_generation")
 
     # Prepare entity information for query generation
     entities_text = ", ".join(analysis["entities"])
@@ -38,40 +48,33 @@ Query generation rules:
 1. Create separate queries for each major entity or aspect
 2. Use bidirectional searches to find all connections: both (n)-[r]->(m) and (m)-[r]->(n)
 3. Use CONTAINS for flexible matching (case-insensitive with toLower)
-4. Limit each query to {config.MAX_QUERY_RESULTS} results for performance
-5. Each query should target a specific aspect identified in the analysis
+4. NEVER inline entity names in the query text: use parameters ($entity, $entity1, $entity2, $relationship) and give their lowercase values in "params"
+5. Always end with LIMIT $limit (limit is {config.MAX_QUERY_RESULTS} for performance)
+6. Each query should target a specific aspect identified in the analysis
 
 Query templates:
 
 Template 1 - Single entity exploration (bidirectional):
-MATCH (n:Source)-[r:TO]->(m:Destination)
-WHERE toLower(n.name) CONTAINS 'entity_name' OR toLower(m.name) CONTAINS 'entity_name'
-RETURN n, r, m
-LIMIT {config.MAX_QUERY_RESULTS}
+{SINGLE_ENTITY_TEMPLATE}
 
 Template 2 - Two-entity interaction:
-MATCH (n:Source)-[r:TO]->(m:Destination)
-WHERE (toLower(n.name) CONTAINS 'entity1' AND toLower(m.name) CONTAINS 'entity2')
-   OR (toLower(n.name) CONTAINS 'entity2' AND toLower(m.name) CONTAINS 'entity1')
-RETURN n, r, m
-LIMIT {config.MAX_QUERY_RESULTS}
+{TWO_ENTITY_TEMPLATE}
 
 Template 3 - Entity with specific relationship type:
-MATCH (n:Source)-[r:TO]->(m:Destination)
-WHERE toLower(n.name) CONTAINS 'entity_name' AND toLower(r.type) CONTAINS 'relationship'
-RETURN n, r, m
-LIMIT {config.MAX_QUERY_RESULTS}
+{RELATIONSHIP_TEMPLATE}
 
 Respond with queries in this JSON format:
 {{
   "queries": [
     {{
       "purpose": "Description of what this query explores",
-      "cypher": "MATCH (n:Source)..."
+      "cypher": "MATCH (n:Source)...",
+      "params": {{"entity": "brca1", "limit": {config.MAX_QUERY_RESULTS}}}
     }},
     {{
       "purpose": "Description of another aspect",
-      "cypher": "MATCH (n:Source)..."
+      "cypher": "MATCH (n:Source)...",
+      "params": {{"entity1": "her2", "entity2": "mmp9", "limit": {config.MAX_QUERY_RESULTS}}}
     }}
   ]
 }}
@@ -81,43 +84,24 @@ RESPOND WITH ONLY VALID JSON, NO MARKDOWN, NO EXPLANATIONS OUTSIDE JSON.
 """
 
     messages = [{'role': 'user', 'content': prompt}]
-    models_to_try = _get_models_list(model_option)
-
-    for model in models_to_try:
-        try:
-            response = client.chat.complete(
-                model=model,
-                messages=messages,
-                temperature=config.QUERY_GENERATION_TEMPERATURE
-            )
-            queries_text = response.choices[0].message.content.strip()
-
-            # Clean up response
-            queries_text = _extract_json(queries_text)
 
-            # Parse JSON
-            queries_data = json.loads(queries_text)
-            return queries_data.get("queries", [])
+    try:
+        queries = complete_with_fallback(
+            client, messages, config.QUERY_GENERATION_TEMPERATURE, "query_generation", model_option,
+            parse=_parse_queries
+        )
+    except AllModelsFailedError:
+        queries = []
 
-        except Exception as e:
-            if model == models_to_try[-1]:
-                return []
-            time.sleep(1)
-            continue
+    # Connections between the entities come from one bounded traversal rather than guessed intermediates;
+    # the expansions go first so they survive the per-question cap
+    return (expansion_queries(analysis) + queries)[:config.MAX_QUERIES_PER_QUESTION]
 
 
-def _build_conversation_context(conversation_history):
-    # Build context string from recent conversation history
-    if not conversation_history or len(conversation_history) <= 1:
-        return ""
-
-    recent_messages = conversation_history[-config.RECENT_MESSAGES_FOR_CONTEXT:]
-    context = "Recent conversation:\n"
-    for msg in recent_messages:
-        content = msg['content'][:200]
-        context += f"{msg['role']}: {content}\n"
-    context += "\n"
-    return context
+def _parse_queries(queries_text):
+    # Extract and parse the queries JSON (raises on unusable output)
+    queries_data = json.loads(_extract_json(queries_text.strip()))
+    return queries_data.get("queries", [])
 
 
 def _extract_json(text):
@@ -127,11 +111,3 @@ def _extract_json(text):
     elif "```" in text:
         return text.split("```")[1].split("```")[0].strip()
     return text
-
-
-def _get_models_list(model_option):
-    # Return list of models to try based on selected option
-    if model_option == "Auto (tries multiple)":
-        return config.DEFAULT_MODELS
-    else:
-        return [model_option]
\ No newline at end of file
@@ -0,0 +1,163 @@
+import threading
+import time
+import config
+import cancellation
+from instrumentation import metrics
+
+
+class RateLimitWaitExceeded(Exception):
+    # Raised when a call would have to queue longer than LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+    def __init__(self, model, wait):
+        super().__init__(f"Client-side rate limit for {model}: would wait {wait:.1f}s")
+        self.model = model
+        self.wait = wait
+
+
+class TokenBucket:
+    # Refills at rate_per_minute up to capacity. Reservations may drive the level negative,
+    # so concurrent callers queue in arrival order, each sleeping until its share has refilled.
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        # Seconds until amount is available (caller holds the limiter lock)
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        # Charge (positive) or refund (negative) the difference between estimated and actual usage
+        self.level = min(self.level - amount, self.capacity)
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class ModelRateLimiter:
+    # Process-wide requests/min and tokens/min budgets per model (MODEL_RATE_LIMITS)
+
+    def __init__(self, limits=None, burst_seconds=None, max_wait=None):
+        self.limits = limits if limits is not None else config.MODEL_RATE_LIMITS
+        self.burst_seconds = burst_seconds or config.LLM_RATE_LIMIT_BURST_SECONDS
+        self.max_wait = max_wait if max_wait is not None else config.LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, model, tokens):
+        # Reserve one request and the estimated tokens, sleeping until the budget allows the call.
+        # Returns the time waited; raises RateLimitWaitExceeded instead of queueing too long.
+        with self._lock:
+            buckets = self._get(model)
+            if buckets is None:
+                return 0.0
+            requests, token_bucket = buckets
+            now = time.monotonic()
+            wait = max(requests.wait_time(1, now), token_bucket.wait_time(tokens, now))
+            if wait > self.max_wait:
+                metrics.inc("llm_rate_limit_rejections_total", help_text="Calls refused by the client-side rate limiter",
+                            model=model)
+                raise RateLimitWaitExceeded(model, wait)
+            requests.reserve(1, now)
+            token_bucket.reserve(tokens, now)
+
+        metrics.observe("llm_rate_limit_wait_seconds", wait, help_text="Time spent queueing for the rate limiter",
+                        model=model)
+        if wait > 0:
+            cancellation.sleep(wait)
+        return wait
+
+    def reconcile(self, model, estimated_tokens, actual_tokens):
+        # Correct the token budget once the response reports real usage
+        if not actual_tokens:
+            return
+        with self._lock:
+            buckets = self._get(model)
+            if buckets is not None:
+                buckets[1].adjust(actual_tokens - estimated_tokens)
+
+    def _get(self, model):
+        if model not in self._buckets:
+            limit = self.limits.get(model, self.limits.get("default"))
+            if not limit:
+                self._buckets[model] = None
+            else:
+                rpm = limit["requests_per_minute"]
+                tpm = limit["tokens_per_minute"]
+                self._buckets[model] = (
+                    TokenBucket(rpm, max(1.0, rpm * self.burst_seconds / 60.0)),
+                    TokenBucket(tpm, max(1.0, tpm * self.burst_seconds / 60.0))
+                )
+        return self._buckets[model]
+
+
+class SingleFlight:
+    # Coalesces identical concurrent calls: the first caller for a key runs the function,
+    # later callers wait for and share its result (or exception)
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func):
+        # Returns (result, shared) where shared is True if another caller's call was reused
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def estimate_tokens(messages):
+    # Rough prompt size (4 characters per token) plus the expected completion length
+    prompt_chars = sum(len(str(msg.get("content", ""))) for msg in messages)
+    return prompt_chars // 4 + config.LLM_RATE_LIMIT_COMPLETION_TOKENS
+
+
+def usage_tokens(usage):
+    # Total tokens reported by the API, or 0 if unknown
+    if usage is None:
+        return 0
+    total = getattr(usage, "total_tokens", None)
+    if total is None:
+        total = (getattr(usage, "prompt_tokens", None) or 0) + (getattr(usage, "completion_tokens", None) or 0)
+    return total or 0
+
+
+# Global limiter and in-flight call registry shared by all stages, sessions and API requests
+rate_limiter = ModelRateLimiter()
+inflight_calls = SingleFlight()
@@ -1,20 +1,71 @@
-import time
 import config
+import cancellation
+from llm_client import complete_with_fallback, stream_complete, AllModelsFailedError
+from model_router import router, models_for_option
 from query_executor import deduplicate_triplets, format_triplets_for_display
+from triplet_ranker import rank_triplets
+from conversation_context import build_conversation_context
+
+NO_RESULTS_MESSAGE = "I searched the knowledge graph but couldn't find information about the specific entities mentioned. Try asking about genes (like BRCA1, TP53), proteins (like HER2), or drugs (like Tamoxifen)."
+SYNTHESIS_FAILURE_MESSAGE = "Found relevant information but had trouble formulating the response. Please try rephrasing your question."
+DIRECT_ANSWER_FAILURE_MESSAGE = "I apologize, but I'm having trouble processing your question right now. Please try again in a moment."
+# Appended to a streamed answer that broke off after every model failed
+TRUNCATED_ANSWER_NOTICE = "\n\n(The response was interrupted. Please try again for a complete answer.)"
+
+# Redundant phrases removed from synthesized answers
+REDUNDANT_PHRASES = [
+    "According to the knowledge graph, ",
+    "The data shows that ",
+    "Based on the relationships, ",
+    "The results indicate that ",
+    "According to the data, ",
+    "The information shows that "
+]
 
 def synthesize_comprehensive_answer(client, question, analysis, query_results, conversation_history=None,
                                     model_option="Auto (tries multiple)"):
 
     if not query_results:
-        return "I searched the knowledge graph but couldn't find information about the specific entities mentioned. Try asking about genes (like BRCA1, TP53), proteins (like HER2), or drugs (like Tamoxifen)."
+        return NO_RESULTS_MESSAGE
 
-    # Deduplicate and limit triplets
-    triplets_list = deduplicate_triplets(query_results, config.MAX_TRIPLETS_FOR_SYNTHESIS)
+    messages = _build_synthesis_messages(question, analysis, query_results, conversation_history)
+
+    try:
+        answer = complete_with_fallback(client, messages, config.SYNTHESIS_TEMPERATURE, "synthesis", model_option)
+    except AllModelsFailedError:
+        return SYNTHESIS_FAILURE_MESSAGE
+
+    # Post-processing: Remove common redundant patterns
+    return _clean_answer(answer.strip())
+
+
+def stream_comprehensive_answer(client, question, analysis, query_results, conversation_history=None,
+                                model_option="Auto (tries multiple)"):
+    # Streaming variant of synthesize_comprehensive_answer: yields cleaned answer text as tokens arrive
+    if not query_results:
+        yield NO_RESULTS_MESSAGE
+        return
+
+    messages = _build_synthesis_messages(question, analysis, query_results, conversation_history)
+    yield from _stream_with_fallback(
+        client, messages, config.SYNTHESIS_TEMPERATURE, "synthesis", model_option,
+        SYNTHESIS_FAILURE_MESSAGE, clean=True
+    )
+
+
+def _build_synthesis_messages(question, analysis, query_results, conversation_history):
+    # Build synthesis prompt from the query results
+
+    # Deduplicate and keep the most relevant triplets
+    if config.TRIPLET_RANKING_ENABLED:
+        triplets_list = rank_triplets(query_results, analysis, config.TRIPLET_RANK_TOP_K)
+    else:
+        triplets_list = deduplicate_triplets(query_results, config.MAX_TRIPLETS_FOR_SYNTHESIS)
 
     # Prepare concise results summary
     results_text = format_triplets_for_display(triplets_list)
 
-    context = _build_conversation_context(conversation_history)
+    context = build_conversation_context(conversation_history, "synthesis")
 
     prompt = f"""You are a biomedical expert. Synthesize a CONCISE, CLEAR answer from knowledge graph data.
 
@@ -52,32 +103,33 @@ Respond in the same language as the question.
 
 Your concise, focused answer:"""
 
-    messages = [{'role': 'user', 'content': prompt}]
-    models_to_try = _get_models_list(model_option)
-
-    for model in models_to_try:
-        try:
-            response = client.chat.complete(
-                model=model,
-                messages=messages,
-                temperature=config.SYNTHESIS_TEMPERATURE
-            )
-            answer = response.choices[0].message.content.strip()
-
-            # Post-processing: Remove common redundant patterns
-            answer = _clean_answer(answer)
-
-            return answer
-        except Exception as e:
-            if model == models_to_try[-1]:
-                return "Found relevant information but had trouble formulating the response. Please try rephrasing your question."
-            time.sleep(1)
-            continue
+    return [{'role': 'user', 'content': prompt}]
 
 
 def generate_direct_answer(client, question, conversation_history=None, model_option="Auto (tries multiple)"):
     # Generate direct answer for patient info, general questions, or conversational messages (no graph search)
-    context = _build_extended_conversation_context(conversation_history)
+    messages = _build_direct_answer_messages(question, conversation_history)
+
+    try:
+        return complete_with_fallback(
+            client, messages, config.DIRECT_ANSWER_TEMPERATURE, "direct_answer", model_option
+        )
+    except AllModelsFailedError:
+        return DIRECT_ANSWER_FAILURE_MESSAGE
+
+
+def stream_direct_answer(client, question, conversation_history=None, model_option="Auto (tries multiple)"):
+    # Streaming variant of generate_direct_answer
+    messages = _build_direct_answer_messages(question, conversation_history)
+    yield from _stream_with_fallback(
+        client, messages, config.DIRECT_ANSWER_TEMPERATURE, "direct_answer", model_option,
+        DIRECT_ANSWER_FAILURE_MESSAGE, clean=False
+    )
+
+
+def _build_direct_answer_messages(question, conversation_history):
+    # Build direct answer prompt with extended conversation context
+    context = build_conversation_context(conversation_history, "direct_answer")
 
     prompt = f"""You are a knowledgeable and empathetic medical assistant specialized in breast cancer.
 
@@ -95,72 +147,99 @@ Instructions:
 
 Your response:"""
 
-    messages = [{'role': 'user', 'content': prompt}]
-    models_to_try = _get_models_list(model_option)
-
-    for model in models_to_try:
-        try:
-            response = client.chat.complete(
-                model=model,
-                messages=messages,
-                temperature=config.DIRECT_ANSWER_TEMPERATURE
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            if model == models_to_try[-1]:
-                return "I apologize, but I'm having trouble processing your question right now. Please try again in a moment."
-            time.sleep(1)
-            continue
-
-
-def _build_conversation_context(conversation_history):
-    # Build short context string from recent conversation history
-    if not conversation_history or len(conversation_history) <= 1:
-        return ""
+    return [{'role': 'user', 'content': prompt}]
 
-    recent_messages = conversation_history[-config.RECENT_MESSAGES_FOR_CONTEXT:]
-    context = "\n\nPrevious conversation:\n"
-    for msg in recent_messages:
-        content = msg['content'][:200]
-        context += f"{msg['role'].title()}: {content}\n"
 
-    return context
+def _stream_with_fallback(client, messages, temperature, stage, model_option, failure_message, clean):
+    # Stream from the first working model. If a stream breaks after text was shown, the next model
+    # continues the partial answer (assistant prefix) instead of starting over.
+    models_to_try = router.order(models_for_option(model_option))
+    cleaner = _StreamingCleaner() if clean else None
+    streamed = ""  # raw text received so far, across models
 
+    if not models_to_try:
+        # Every circuit is open: fail fast instead of waiting for a model to recover
+        yield failure_message
+        return
 
-def _build_extended_conversation_context(conversation_history):
-    # Build extended context string with more conversation history
-    if not conversation_history or len(conversation_history) <= 1:
-        return ""
+    for attempt, model in enumerate(models_to_try):
+        delay = router.backoff_delay(attempt, model)
+        if delay:
+            cancellation.sleep(delay)
 
-    recent_messages = conversation_history[-config.MAX_CONVERSATION_HISTORY:]
-    context = "\n\nConversation history:\n"
-    for msg in recent_messages:
-        content = msg['content'][:300]
-        context += f"{msg['role'].title()}: {content}\n"
+        request_messages = messages
+        if streamed:
+            request_messages = messages + [{'role': 'assistant', 'content': streamed, 'prefix': True}]
 
-    return context
+        try:
+            for chunk in _strip_echoed_prefix(
+                    stream_complete(client, model, request_messages, temperature, stage=stage), streamed):
+                if not streamed:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                streamed += chunk
+                text = cleaner.feed(chunk) if cleaner else chunk
+                if text:
+                    yield text
+
+            if cleaner:
+                yield cleaner.flush()
+            return
+        except Exception:
+            # A cancelled request ends here rather than falling back to the next model
+            cancellation.check_cancelled()
+            if model == models_to_try[-1]:
+                if cleaner:
+                    yield cleaner.flush()
+                yield TRUNCATED_ANSWER_NOTICE if streamed else failure_message
+                return
+
+
+def _strip_echoed_prefix(chunks, prefix):
+    # Drop the assistant prefix if the continuing model repeats it at the start of its output
+    if not prefix:
+        yield from chunks
+        return
+
+    pending = ""
+    for chunk in chunks:
+        if pending is None:
+            yield chunk
+            continue
+        pending += chunk
+        if len(pending) < len(prefix) and prefix.startswith(pending):
+            continue
+        yield pending[len(prefix):] if pending.startswith(prefix) else pending
+        pending = None
 
 
 def _clean_answer(answer):
     # Remove redundant phrases like "According to the data" from answer
-    redundant_phrases = [
-        "According to the knowledge graph, ",
-        "The data shows that ",
-        "Based on the relationships, ",
-        "The results indicate that ",
-        "According to the data, ",
-        "The information shows that "
-    ]
-
-    for phrase in redundant_phrases:
+    for phrase in REDUNDANT_PHRASES:
         answer = answer.replace(phrase, "")
 
     return answer
 
 
-def _get_models_list(model_option):
-    # Return list of models to try based on selected option
-    if model_option == "Auto (tries multiple)":
-        return config.DEFAULT_MODELS
-    else:
-        return [model_option]
\ No newline at end of file
+class _StreamingCleaner:
+    # Incremental _clean_answer: holds back just enough text to catch a phrase split across chunks
+
+    def __init__(self):
+        self._buffer = ""
+        self._holdback = max(len(phrase) for phrase in REDUNDANT_PHRASES) - 1
+
+    def feed(self, chunk):
+        # Return cleaned text that can safely be shown
+        self._buffer = _clean_answer(self._buffer + chunk)
+        if len(self._buffer) <= self._holdback:
+            return ""
+        text = self._buffer[:-self._holdback]
+        self._buffer = self._buffer[-self._holdback:]
+        return text
+
+    def flush(self):
+        # Return the remaining held-back text, without trailing whitespace (like the non-streamed answer)
+        text = _clean_answer(self._buffer).rstrip()
+        self._buffer = ""
+        return text
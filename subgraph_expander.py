@@ -0,0 +1,137 @@
+import hashlib
+import json
+import config
+from triplet import as_triplet
+
+
+def expand_paths(client, spec):
+    # Triplets on the shortest paths between the entities of an "expand" query object, deduplicated in
+    # path order. spec: {"source", "target", optional "relations", "max_hops", "fanout"}. Relation filters
+    # only narrow the search: when no path uses the wanted relation types, any relation type is allowed.
+    cache = getattr(client, "cache", None)
+    if cache is not None:
+        key = _cache_key(spec)
+        found, triplets = cache.get(key)
+        if found:
+            return [as_triplet(triplet) for triplet in triplets]
+
+    relations = tuple(spec.get("relations") or ())
+    max_hops = spec.get("max_hops", config.SUBGRAPH_MAX_HOPS)
+    fanout = spec.get("fanout", config.SUBGRAPH_FANOUT)
+    source_seeds, target_seeds = _seeds(client, spec["source"], spec["target"])
+    paths = _shortest_paths(client, source_seeds, target_seeds, relations, max_hops, fanout)
+    if not paths and relations:
+        paths = _shortest_paths(client, source_seeds, target_seeds, (), max_hops, fanout)
+
+    triplets = []
+    seen = set()
+    for path in paths:
+        for triplet in path:
+            if triplet not in seen:
+                seen.add(triplet)
+                triplets.append(triplet)
+    triplets = triplets[:config.MAX_QUERY_RESULTS]
+
+    if cache is not None:
+        cache.set(key, triplets)
+    return triplets
+
+
+def find_paths(client, source, target, relations=(), max_hops=None, fanout=None, max_paths=None):
+    # Shortest paths (lists of Triplets, each in graph direction) between nodes matching the source and
+    # target terms, by bidirectional BFS: each step expands the smaller frontier by one hop, following
+    # at most fanout edges per node and SUBGRAPH_MAX_FRONTIER nodes per hop, until the searches meet.
+    # The client provides find_nodes(term, limit) and expand_frontier(names, relations, fanout).
+    source_seeds, target_seeds = _seeds(client, source, target)
+    return _shortest_paths(client, source_seeds, target_seeds, relations, max_hops, fanout, max_paths)
+
+
+def _seeds(client, source, target):
+    # Start nodes of both searches; a node matching both terms only starts the source search
+    source, target = source.strip().lower(), target.strip().lower()
+    if not source or not target or source == target:
+        return [], []
+    source_seeds = client.find_nodes(source, config.SUBGRAPH_MAX_SEEDS)
+    if not source_seeds:
+        return [], []
+    target_seeds = [name for name in client.find_nodes(target, config.SUBGRAPH_MAX_SEEDS)
+                    if name not in source_seeds]
+    return source_seeds, target_seeds
+
+
+def _shortest_paths(client, source_seeds, target_seeds, relations=(), max_hops=None, fanout=None, max_paths=None):
+    max_hops = max_hops or config.SUBGRAPH_MAX_HOPS
+    fanout = fanout or config.SUBGRAPH_FANOUT
+    max_paths = max_paths or config.SUBGRAPH_MAX_PATHS
+    if not source_seeds or not target_seeds:
+        return []
+
+    sides = (_Search(source_seeds, max_paths), _Search(target_seeds, max_paths))
+    relations = tuple(relation.strip().lower() for relation in relations if relation.strip())
+    meeting = set()
+    hops = 0
+    while not meeting and hops < max_hops:
+        expandable = [side for side in sides if side.frontier]
+        if not expandable:
+            break
+        min(expandable, key=lambda side: len(side.frontier)).expand(client, relations, fanout)
+        hops += 1
+        meeting = sides[0].depth.keys() & sides[1].depth.keys()
+
+    # Shortest connections first; target-side paths are walked back from the meeting node
+    paths = []
+    for node in sorted(meeting, key=lambda node: (sides[0].depth[node] + sides[1].depth[node], node)):
+        for head in sides[0].paths_to(node):
+            for tail in sides[1].paths_to(node):
+                paths.append(head + tail[::-1])
+                if len(paths) >= max_paths:
+                    return paths
+    return paths
+
+
+class _Search:
+    # One direction of the bidirectional search: BFS depth and parent edges of every reached node
+
+    def __init__(self, seeds, max_paths):
+        self.depth = {name: 0 for name in seeds}
+        self.parents = {name: [] for name in seeds}
+        self.frontier = list(seeds)
+        self.max_paths = max_paths
+
+    def expand(self, client, relations, fanout):
+        # Advance the frontier one hop. Nodes reached at the same depth over several edges keep (up to
+        # max_paths) parents, so alternative shortest paths survive.
+        frontier = set(self.frontier)
+        next_depth = self.depth[self.frontier[0]] + 1
+        next_frontier = []
+        for triplet in client.expand_frontier(self.frontier, relations, fanout):
+            for here, there in ((triplet.source, triplet.destination), (triplet.destination, triplet.source)):
+                if here not in frontier:
+                    continue
+                if there not in self.depth:
+                    self.depth[there] = next_depth
+                    self.parents[there] = [(triplet, here)]
+                    next_frontier.append(there)
+                elif self.depth[there] == next_depth and len(self.parents[there]) < self.max_paths:
+                    self.parents[there].append((triplet, here))
+        # Nodes beyond the frontier cap can still be meeting points, they are just not expanded
+        self.frontier = next_frontier[:config.SUBGRAPH_MAX_FRONTIER]
+
+    def paths_to(self, node):
+        # Edge lists from a seed to node, at most max_paths
+        if not self.parents[node]:
+            return [[]]
+        paths = []
+        for triplet, parent in self.parents[node]:
+            for path in self.paths_to(parent):
+                paths.append(path + [triplet])
+                if len(paths) >= self.max_paths:
+                    return paths
+        return paths
+
+
+def _cache_key(spec):
+    # Result cache key of an expansion, distinct from the keys of Cypher queries
+    payload = json.dumps(["expand", spec, config.SUBGRAPH_MAX_SEEDS, config.SUBGRAPH_MAX_PATHS], sort_keys=True,
+                         default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,52 @@
+import pytest
+import config
+from cypher_guard import _analyze, guard_query, CypherRejected
+
+# Queries with the expected outcome of the static checks: the rewrite action (None when the query runs
+# unchanged) or "rejected: <reason>"
+EXAMPLES = [
+    ("MATCH (n:Source)-[r:TO]->(m) RETURN n, r, m LIMIT 10", None),
+    ("MATCH (n) WHERE toLower(n.name) CONTAINS $entity RETURN n LIMIT $limit", None),
+    ("MATCH (n) RETURN n { .name, set: 1 } LIMIT 3", None),
+    ("MATCH (n) WHERE n.name = 'DELETE me' RETURN n", "limit_added"),
+    ("MATCH (n) RETURN n.name AS name LIMIT 5 UNION MATCH (m) RETURN m.name AS name", "limit_added"),
+    ("MATCH (n) RETURN n.name AS name LIMIT 5 UNION ALL MATCH (m) RETURN m.name AS name LIMIT 100000",
+     "limit_clamped"),
+    ("MATCH (n) RETURN n LIMIT 5 + 1000", "rejected: limit_expression"),
+    ("MATCH p = (a)-[:TO*1..3]->(b) RETURN p LIMIT 5", None),
+    ("MATCH (a)-[:TO*]->(b) RETURN b", "rejected: unbounded_path"),
+    ("MATCH (a)-[:TO*2..]->(b) RETURN b", "rejected: unbounded_path"),
+    ("MATCH (a)-[:TO*..10]->(b) RETURN b", "rejected: path_too_long"),
+    ("MATCH (a)-[:TO]->(b), (b)-[:TO]->(c) RETURN a, c LIMIT 5", None),
+    ("MATCH (a)-[:TO]->(b) OPTIONAL MATCH (b)-[:TO]->(c) RETURN a, c LIMIT 5", None),
+    ("MATCH (a:Source), (b:Destination) RETURN a, b LIMIT 5", "rejected: cartesian_product"),
+    ("MATCH (n:Source) MATCH (m:Destination) RETURN n, m LIMIT 3", "rejected: cartesian_product"),
+    ("MATCH (n:Source) OPTIONAL MATCH (m:Destination) RETURN n, m LIMIT 3", "rejected: cartesian_product"),
+    ("MATCH (n) SET n.flag = 1 RETURN n", "rejected: write_clause"),
+    ("MATCH (n) SET n:Hidden RETURN n", "rejected: write_clause"),
+    ("MATCH (n) RETURN n; MATCH (m) DETACH DELETE m", "rejected: multiple_statements"),
+    ("CALL dbms.procedures() YIELD name RETURN name", "rejected: procedure_call"),
+    ("SHOW DATABASES", "rejected: admin_command"),
+]
+
+
+@pytest.mark.parametrize("cypher, expected", EXAMPLES)
+def test_static_checks(cypher, expected):
+    analysis = _analyze(cypher)
+    assert (f"rejected: {analysis}" if isinstance(analysis, str) else analysis[2]) == expected
+
+
+def test_limit_added_to_every_union_branch():
+    cypher, _ = guard_query("MATCH (n) RETURN n.name AS name UNION MATCH (m) RETURN m.name AS name LIMIT 900")
+    assert cypher.count(f"LIMIT {config.MAX_QUERY_RESULTS}") == 2
+
+
+def test_limit_parameter_clamped():
+    _, params = guard_query("MATCH (n) RETURN n LIMIT $limit", {"limit": 10000})
+    assert params["limit"] == config.MAX_QUERY_RESULTS
+
+
+def test_rejection_reason():
+    with pytest.raises(CypherRejected) as excinfo:
+        guard_query("MATCH (n) DETACH DELETE n")
+    assert excinfo.value.reason == "write_clause"
@@ -0,0 +1,62 @@
+import sys
+
+# Field order of a triplet
+FIELDS = ("source", "relation", "destination")
+_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+
+class Triplet(tuple):
+    # Compact (source, relation, destination) with interned strings. Also readable like the
+    # dicts used before (triplet['source'], .get, .keys), so callers need not change.
+    __slots__ = ()
+
+    def __new__(cls, source, relation, destination):
+        return tuple.__new__(cls, (_intern(source), _intern(relation), _intern(destination)))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = _INDEX[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __repr__(self):
+        return f"Triplet{tuple.__repr__(self)}"
+
+    @property
+    def source(self):
+        return tuple.__getitem__(self, 0)
+
+    @property
+    def relation(self):
+        return tuple.__getitem__(self, 1)
+
+    @property
+    def destination(self):
+        return tuple.__getitem__(self, 2)
+
+    def get(self, key, default=None):
+        return self[key] if key in _INDEX else default
+
+    def keys(self):
+        return FIELDS
+
+    def to_dict(self):
+        return dict(zip(FIELDS, self))
+
+
+def as_triplet(value):
+    # Triplet from a Triplet, a {source, relation, destination} dict or a 3-item sequence (e.g. from JSON)
+    if isinstance(value, Triplet):
+        return value
+    if isinstance(value, dict):
+        return Triplet(value['source'], value['relation'], value['destination'])
+    return Triplet(*value)
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
@@ -0,0 +1,113 @@
+import heapq
+import math
+import re
+import config
+
+# Entity match strengths of a node name against an entity term
+EXACT_MATCH = 1.0
+WORD_MATCH = 0.7
+SUBSTRING_MATCH = 0.4
+
+_WORD = re.compile(r"\w+")
+
+
+def rank_triplets(query_results, analysis, k=None):
+    # Select the k most relevant triplets of all query results for synthesis: deduplicated (in either
+    # direction), scored by entity match, relation relevance, cross-query support and degree within
+    # the retrieved subgraph, then picked best-first with at most TRIPLET_RANK_MAX_PER_RELATION per
+    # relation type until the other types are exhausted
+    k = k or config.TRIPLET_RANK_TOP_K
+    candidates = _collect(query_results)
+    if not candidates:
+        return []
+
+    entity_terms = [_term(entity) for entity in analysis.get("entities", []) if _term(entity)]
+    entity_patterns = [(term, re.compile(rf"\b{re.escape(term)}\b")) for term in entity_terms]
+    relation_terms = [_term(relation) for relation in analysis.get("relationships_to_explore", []) if _term(relation)]
+    relation_words = [set(_WORD.findall(term)) for term in relation_terms]
+
+    degree = {}
+    for triplet, _ in candidates.values():
+        for name in (triplet['source'].lower(), triplet['destination'].lower()):
+            degree[name] = degree.get(name, 0) + 1
+    max_degree = max(degree.values())
+
+    weights = config.TRIPLET_RANK_WEIGHTS
+    heap = []
+    for index, (triplet, queries) in enumerate(candidates.values()):
+        source = triplet['source'].lower()
+        destination = triplet['destination'].lower()
+        source_match = _entity_match(source, entity_patterns)
+        destination_match = _entity_match(destination, entity_patterns)
+
+        centrality = max(degree[source], degree[destination])
+        score = (
+            weights["entity"] * max(source_match, destination_match)
+            + weights["entity_pair"] * min(source_match, destination_match)
+            + weights["relation"] * _relation_relevance(triplet['relation'].lower(), relation_terms, relation_words)
+            + weights["support"] * (len(queries) - 1)
+            + weights["degree"] * math.log1p(centrality) / math.log1p(max_degree)
+        )
+        # Ties keep the original (query) order
+        heap.append((-score, index, triplet))
+    heapq.heapify(heap)
+
+    selected = []
+    deferred = []
+    per_relation = {}
+    while heap and len(selected) < k:
+        _, _, triplet = heapq.heappop(heap)
+        relation = triplet['relation'].lower()
+        if per_relation.get(relation, 0) >= config.TRIPLET_RANK_MAX_PER_RELATION:
+            deferred.append(triplet)
+            continue
+        per_relation[relation] = per_relation.get(relation, 0) + 1
+        selected.append(triplet)
+
+    # Not enough distinct relation types: fill up with the best of the capped ones
+    selected.extend(deferred[:k - len(selected)])
+    return selected
+
+
+def _collect(query_results):
+    # Unique triplets (either direction) -> (first occurrence, indices of the queries returning it)
+    candidates = {}
+    for query_index, result in enumerate(query_results):
+        for triplet in result['triplets']:
+            source = triplet['source'].lower()
+            relation = triplet['relation'].lower()
+            destination = triplet['destination'].lower()
+            key = (source, relation, destination)
+            if key not in candidates:
+                reverse_key = (destination, relation, source)
+                key = reverse_key if reverse_key in candidates else key
+            if key in candidates:
+                candidates[key][1].add(query_index)
+            else:
+                candidates[key] = (triplet, {query_index})
+    return candidates
+
+
+def _entity_match(name, entity_patterns):
+    # Strongest match of a node name against the question's entities
+    best = 0.0
+    for term, pattern in entity_patterns:
+        if name == term:
+            return EXACT_MATCH
+        if term in name:
+            best = max(best, WORD_MATCH if pattern.search(name) else SUBSTRING_MATCH)
+    return best
+
+
+def _relation_relevance(relation, relation_terms, relation_words):
+    # 1 if a relationship of interest appears in the relation type, 0.5 if they share a word
+    if not relation_terms or not relation:
+        return 0.0
+    if any(term in relation or relation in term for term in relation_terms):
+        return 1.0
+    words = set(_WORD.findall(relation))
+    return 0.5 if any(words & term_words for term_words in relation_words) else 0.0
+
+
+def _term(value):
+    return value.strip().lower() if isinstance(value, str) else ""